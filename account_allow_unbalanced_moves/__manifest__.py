@@ -12,6 +12,8 @@
     'data': [
         # 'security/security.xml',
         'views/account_view.xml',
+        'views/account_move_imbalance_view.xml',
+        'views/account_move_bulk_import_view.xml',
     ],
     'installable': True,
     'auto_install': False,
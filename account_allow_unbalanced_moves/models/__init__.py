@@ -1,2 +1,3 @@
 # -*- coding: utf-8 -*-
 from . import account
+from . import account_move_bulk_import
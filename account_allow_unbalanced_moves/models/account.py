@@ -1,6 +1,7 @@
 # -*- encoding: utf-8 -*-
 
 from odoo import fields, models, api, exceptions, _
+from odoo.tools.sql import column_exists, create_column
 
 
 class AccountJournal(models.Model):
@@ -15,8 +16,88 @@ class AccountJournal(models.Model):
 class AccountMove(models.Model):
     _inherit = 'account.move'
 
+    amount_imbalance = fields.Monetary(
+        string=_('Imbalance'),
+        compute='_compute_amount_imbalance',
+        store=True,
+        readonly=True,
+        help="Total debit minus total credit of the journal items.",
+    )
+
+    @api.model_cr_context
+    def _auto_init(self):
+        """ Creates and fills the imbalance column with one grouped update
+        before the ORM sees the field, so installing the module does not
+        recompute it move by move. """
+        cr = self._cr
+        if not column_exists(cr, 'account_move', 'amount_imbalance'):
+            create_column(cr, 'account_move', 'amount_imbalance', 'numeric')
+            cr.execute("""
+                UPDATE account_move m
+                SET amount_imbalance = t.imbalance
+                FROM (
+                    SELECT l.move_id,
+                           CASE WHEN cur.id IS NULL THEN sum(l.debit) - sum(l.credit)
+                                ELSE round((sum(l.debit) - sum(l.credit))::numeric, cur.decimal_places)
+                           END AS imbalance
+                    FROM account_move_line l
+                    JOIN account_move lm ON lm.id = l.move_id
+                    LEFT JOIN res_currency cur ON cur.id = lm.currency_id
+                    GROUP BY l.move_id, cur.id
+                ) t
+                WHERE m.id = t.move_id
+            """)
+        return super(AccountMove, self)._auto_init()
+
+    @api.model_cr
+    def init(self):
+        # Only unbalanced moves are indexed, so the index stays tiny
+        self._cr.execute("""
+            CREATE INDEX IF NOT EXISTS account_move_amount_imbalance_idx
+            ON account_move (journal_id, date)
+            WHERE amount_imbalance != 0
+        """)
+
+    @api.multi
+    @api.depends('line_ids.debit', 'line_ids.credit')
+    def _compute_amount_imbalance(self):
+        for move in self:
+            imbalance = sum(move.line_ids.mapped('debit')) - sum(move.line_ids.mapped('credit'))
+            move.amount_imbalance = move.currency_id.round(imbalance) if move.currency_id else imbalance
+
     @api.multi
     def assert_balanced(self):
-        if self.journal_id.allow_unbalanced_moves:
+        """ Leaves the moves of journals allowing unbalanced moves out of the
+        standard check. When it fails, the unbalanced moves are named in the
+        error with a single grouped query. """
+        if not self.ids:
+            return True
+        enforced = self.filtered(lambda move: not move.journal_id.allow_unbalanced_moves)
+        if not enforced:
             return True
-        return super(AccountMove,self).assert_balanced()
+        try:
+            return super(AccountMove, enforced).assert_balanced()
+        except exceptions.UserError:
+            unbalanced = enforced._get_unbalanced_moves()
+            if not unbalanced:
+                raise
+            raise exceptions.UserError(_("Cannot create unbalanced journal entry.") + '\n' + '\n'.join(
+                '%s%s: %s' % (name if name and name != '/' else '#%s' % move_id,
+                              ref and ' (%s)' % ref or '', difference)
+                for move_id, name, ref, difference in unbalanced))
+
+    @api.multi
+    def _get_unbalanced_moves(self):
+        """ Returns id, name, reference and difference of the unbalanced
+        moves, with the same tolerance as assert_balanced. """
+        prec = self.env.user.company_id.currency_id.decimal_places
+        self._cr.execute("""
+            SELECT m.id, m.name, m.ref, sum(l.debit) - sum(l.credit)
+            FROM account_move_line l
+            JOIN account_move m ON m.id = l.move_id
+            WHERE l.move_id IN %s
+            GROUP BY m.id
+            HAVING abs(sum(l.debit) - sum(l.credit)) > %s
+            ORDER BY m.id
+        """, (tuple(self.ids), 10 ** (-max(5, prec))))
+        return self._cr.fetchall()
@@ -0,0 +1,289 @@
+# -*- encoding: utf-8 -*-
+import base64
+import csv
+import io
+import logging
+
+from odoo import fields, models, api, exceptions, _
+from odoo.tools import split_every
+
+_logger = logging.getLogger(__name__)
+
+MOVE_LINE_COLUMNS = [
+    'move_id', 'account_id', 'partner_id', 'name', 'debit', 'credit', 'date_maturity',
+    'quantity', 'amount_currency', 'blocked', 'tax_exigible',
+]
+
+
+def _insert_rows(cr, table, columns, rows):
+    """ Inserts the rows with a single statement and returns their ids, in
+    the same order. """
+    placeholders = '(%s)' % ', '.join(['%s'] * len(columns) + ["%s", "%s", "now() at time zone 'UTC'", "now() at time zone 'UTC'"])
+    cr.execute("""
+        INSERT INTO %s (%s, create_uid, write_uid, create_date, write_date)
+        VALUES %s
+        RETURNING id
+    """ % (table, ', '.join(columns), ', '.join([placeholders] * len(rows))),
+        [value for row in rows for value in row])
+    return [row[0] for row in cr.fetchall()]
+
+
+class AccountMoveBulkImportWizard(models.TransientModel):
+    _name = 'account.move.bulk.import.wizard'
+
+    journal_id = fields.Many2one(
+        comodel_name='account.journal',
+        string=_('Journal'),
+        required=True,
+        domain=[('allow_unbalanced_moves', '=', True)],
+    )
+
+    batch_size = fields.Integer(
+        string=_('Batch size'),
+        default=5000,
+    )
+
+    # Kept in the filestore, so the import reads the file instead of
+    # decoding the whole upload in memory
+    data_file = fields.Binary(
+        string=_('File'),
+        attachment=True,
+    )
+
+    filename = fields.Char()
+
+    skip_balance_check = fields.Boolean(
+        string=_('Import unbalanced moves'),
+        help="Unless checked, the import is cancelled if any imported move is unbalanced.",
+    )
+
+    move_count = fields.Integer(
+        string=_('Moves'),
+        readonly=True,
+    )
+
+    line_count = fields.Integer(
+        string=_('Journal items'),
+        readonly=True,
+    )
+
+    summary_ids = fields.One2many(
+        comodel_name='account.move.bulk.import.wizard.line',
+        inverse_name='wizard_id',
+        string=_('Summary'),
+        readonly=True,
+    )
+
+    def _open_csv(self):
+        attachment = self.env['ir.attachment'].sudo().search([
+            ('res_model', '=', self._name),
+            ('res_id', '=', self.id),
+            ('res_field', '=', 'data_file'),
+        ], limit=1)
+        if not attachment:
+            raise exceptions.UserError(_('Please select a file.'))
+        if attachment.store_fname:
+            return io.open(attachment._full_path(attachment.store_fname), 'r', encoding='utf-8', newline='')
+        # Attachments stored in the database
+        return io.TextIOWrapper(io.BytesIO(base64.b64decode(attachment.datas)), encoding='utf-8', newline='')
+
+    def _parse_amount(self, value, line):
+        try:
+            return float(value or 0.0)
+        except ValueError:
+            raise exceptions.UserError(_('Invalid amount %s on line %s.') % (value, line))
+
+    def _parse_date(self, value, line):
+        try:
+            return fields.Date.to_date(value)
+        except ValueError:
+            raise exceptions.UserError(_('Invalid date %s on line %s.') % (value, line))
+
+    def _get_partner(self, value, cache):
+        if value not in cache:
+            partner = self.env['res.partner'].search([
+                ('ref', '=', value),
+                ('company_id', 'in', [self.journal_id.company_id.id, False]),
+            ], limit=1)
+            if not partner:
+                raise exceptions.UserError(_('Unknown partner: %s') % value)
+            cache[value] = partner.id
+        return cache[value]
+
+    def _insert_moves(self, refs, dates):
+        journal = self.journal_id
+        company = journal.company_id
+        uid = self.env.uid
+        rows = [(ref, dates[ref], '/', 'draft', journal.id, company.id, company.currency_id.id,
+                 0.0, 0.0, uid, uid) for ref in refs]
+        return _insert_rows(self.env.cr, 'account_move', [
+            'ref', 'date', 'name', 'state', 'journal_id', 'company_id', 'currency_id',
+            'amount', 'amount_imbalance',
+        ], rows)
+
+    def _flush_lines(self, rows, move_ids):
+        """ Inserts a batch of journal items and computes their stored
+        related and computed fields with one update. """
+        uid = self.env.uid
+        line_ids = _insert_rows(self.env.cr, 'account_move_line', MOVE_LINE_COLUMNS, [
+            (move_ids[ref],) + values + (uid, uid) for ref, values in rows])
+        self.env.cr.execute("""
+            UPDATE account_move_line l
+            SET balance = l.debit - l.credit,
+                debit_cash_basis = l.debit,
+                credit_cash_basis = l.credit,
+                balance_cash_basis = l.debit - l.credit,
+                amount_residual = CASE WHEN a.reconcile THEN l.debit - l.credit ELSE 0 END,
+                amount_residual_currency = 0,
+                reconciled = false,
+                company_id = a.company_id,
+                company_currency_id = c.currency_id,
+                user_type_id = a.user_type_id,
+                journal_id = m.journal_id,
+                date = m.date,
+                ref = m.ref
+            FROM account_move m, account_account a, res_company c
+            WHERE l.id IN %s AND m.id = l.move_id AND a.id = l.account_id AND c.id = a.company_id
+        """, (tuple(line_ids),))
+        return line_ids
+
+    def _update_moves(self, move_ids):
+        """ Computes amount, partner, matched percentage and imbalance of the
+        moves from their journal items, with one update per chunk. """
+        for chunk in split_every(10000, move_ids):
+            self.env.cr.execute("""
+                UPDATE account_move m
+                SET amount = t.debit,
+                    amount_imbalance = round((t.debit - t.credit)::numeric, cur.decimal_places),
+                    partner_id = CASE WHEN t.partner_count = 1 THEN t.partner_id END,
+                    matched_percentage = CASE WHEN t.payable THEN 0.0 ELSE 1.0 END
+                FROM (
+                    SELECT l.move_id, sum(l.debit) AS debit, sum(l.credit) AS credit,
+                           count(DISTINCT l.partner_id) AS partner_count, max(l.partner_id) AS partner_id,
+                           bool_or(ut.type IN ('receivable', 'payable')) AS payable
+                    FROM account_move_line l
+                    JOIN account_account_type ut ON ut.id = l.user_type_id
+                    WHERE l.move_id IN %s
+                    GROUP BY l.move_id
+                ) t, res_currency cur
+                WHERE m.id = t.move_id AND cur.id = m.currency_id
+            """, (tuple(chunk),))
+
+    @api.multi
+    def action_import(self):
+        """ Streams the CSV and loads the journal entries in batches of SQL
+        inserts, then computes the derived fields of all of them set-wise
+        and reports the imbalance of every move. """
+        self.ensure_one()
+        # Moves and items are written by SQL, so the ORM does not check access
+        if not self.env.user.has_group('account.group_account_manager'):
+            raise exceptions.AccessError(_('Only accounting advisers can import journal entries.'))
+        for model in ('account.move', 'account.move.line'):
+            self.env[model].check_access_rights('create')
+        journal = self.journal_id
+        journal.check_access_rule('read')
+        if journal.company_id not in self.env.user.company_ids:
+            raise exceptions.AccessError(_('You cannot import entries into a journal of another company.'))
+        if not journal.allow_unbalanced_moves:
+            raise exceptions.UserError(_('The journal %s does not allow unbalanced moves.') % journal.name)
+        cr = self.env.cr
+        cr.execute("SELECT code, id FROM account_account WHERE company_id = %s AND deprecated IS NOT TRUE",
+                   (journal.company_id.id,))
+        accounts = dict(cr.fetchall())
+        partners = {}
+        move_ids = {}
+        new_refs, dates = [], {}
+        batch = []
+        line_count = 0
+        batch_size = self.batch_size or 5000
+
+        def flush():
+            if new_refs:
+                move_ids.update(zip(new_refs, self._insert_moves(new_refs, dates)))
+                del new_refs[:]
+            self._flush_lines(batch, move_ids)
+            _logger.info("Imported %s journal items in %s moves", line_count, len(move_ids))
+            del batch[:]
+
+        with self._open_csv() as csv_file:
+            reader = csv.DictReader(csv_file)
+            for row in reader:
+                ref = (row.get('move') or '').strip()
+                if not ref:
+                    raise exceptions.UserError(_('Missing move reference on line %s.') % reader.line_num)
+                if ref not in dates:
+                    dates[ref] = self._parse_date((row.get('date') or '').strip(), reader.line_num)
+                    if not dates[ref]:
+                        raise exceptions.UserError(_('Missing date of move %s.') % ref)
+                    new_refs.append(ref)
+                code = (row.get('account') or '').strip()
+                if code not in accounts:
+                    raise exceptions.UserError(_('Unknown account: %s') % code)
+                partner = (row.get('partner') or '').strip()
+                batch.append((ref, (
+                    accounts[code],
+                    partner and self._get_partner(partner, partners) or None,
+                    row.get('name') or '/',
+                    self._parse_amount((row.get('debit') or '').strip(), reader.line_num),
+                    self._parse_amount((row.get('credit') or '').strip(), reader.line_num),
+                    dates[ref],
+                    1.0, 0.0, False, True,
+                )))
+                line_count += 1
+                if len(batch) >= batch_size:
+                    flush()
+            if batch:
+                flush()
+
+        ids = list(move_ids.values())
+        self._update_moves(ids)
+        self.env['account.move'].invalidate_cache()
+        self.env['account.move.line'].invalidate_cache()
+        summary = self._get_imbalance_summary(ids)
+        if not self.skip_balance_check and any(imbalance for move_id, debit, credit, imbalance in summary):
+            raise exceptions.UserError(_("Cannot create unbalanced journal entry.") + '\n' + '\n'.join(
+                '%s: %s' % (self.env['account.move'].browse(move_id).ref, imbalance)
+                for move_id, debit, credit, imbalance in summary if imbalance))
+        self.write({
+            'move_count': len(ids),
+            'line_count': line_count,
+            'summary_ids': [(5, 0, 0)] + [(0, 0, {
+                'move_id': move_id,
+                'debit': debit,
+                'credit': credit,
+                'amount_imbalance': imbalance,
+            }) for move_id, debit, credit, imbalance in summary],
+        })
+        return self._reopen()
+
+    def _get_imbalance_summary(self, move_ids):
+        if not move_ids:
+            return []
+        self.env.cr.execute("""
+            SELECT m.id, m.amount, m.amount - m.amount_imbalance, m.amount_imbalance
+            FROM account_move m
+            WHERE m.id IN %s
+            ORDER BY abs(m.amount_imbalance) DESC, m.id
+        """, (tuple(move_ids),))
+        return self.env.cr.fetchall()
+
+    def _reopen(self):
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+
+
+class AccountMoveBulkImportWizardLine(models.TransientModel):
+    _name = 'account.move.bulk.import.wizard.line'
+    _order = 'id'
+
+    wizard_id = fields.Many2one('account.move.bulk.import.wizard', required=True, ondelete='cascade')
+    move_id = fields.Many2one('account.move', string=_('Journal Entry'), readonly=True)
+    currency_id = fields.Many2one('res.currency', related='move_id.currency_id', readonly=True)
+    debit = fields.Monetary(string=_('Debit'), readonly=True)
+    credit = fields.Monetary(string=_('Credit'), readonly=True)
+    amount_imbalance = fields.Monetary(string=_('Imbalance'), readonly=True)
@@ -0,0 +1,76 @@
+# -*- encoding: utf-8 -*-
+from odoo import fields
+from odoo.exceptions import UserError
+from odoo.tests.common import SavepointCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestAssertBalanced(SavepointCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestAssertBalanced, cls).setUpClass()
+        cls.company = cls.env.user.company_id
+        cls.accounts = cls.env['account.account'].search([('company_id', '=', cls.company.id)], limit=2)
+        Journal = cls.env['account.journal']
+        cls.allowed_journal = Journal.create({
+            'name': 'Unbalanced allowed',
+            'code': 'UNBA',
+            'type': 'general',
+            'company_id': cls.company.id,
+            'allow_unbalanced_moves': True,
+        })
+        cls.enforced_journal = Journal.create({
+            'name': 'Unbalanced enforced',
+            'code': 'UNBE',
+            'type': 'general',
+            'company_id': cls.company.id,
+        })
+
+    def setUp(self):
+        super(TestAssertBalanced, self).setUp()
+        if len(self.accounts) < 2:
+            self.skipTest("A chart of accounts is required")
+
+    def _create_move(self, journal, ref, debit, credit):
+        return self.env['account.move'].create({
+            'journal_id': journal.id,
+            'date': fields.Date.today(),
+            'ref': ref,
+            'line_ids': [
+                (0, 0, {'name': ref, 'account_id': self.accounts[0].id, 'debit': debit, 'credit': 0.0}),
+                (0, 0, {'name': ref, 'account_id': self.accounts[1].id, 'debit': 0.0, 'credit': credit}),
+            ],
+        })
+
+    def _unbalance(self, move, amount):
+        self.env.cr.execute("UPDATE account_move_line SET debit = debit + %s WHERE id = %s",
+                            (amount, move.line_ids.filtered('debit')[0].id))
+        move.invalidate_cache()
+
+    def _create_moves(self):
+        return (self._create_move(self.allowed_journal, 'ALLOWED-1', 100.0, 90.0)
+                | self._create_move(self.enforced_journal, 'ENFORCED-1', 100.0, 100.0)
+                | self._create_move(self.allowed_journal, 'ALLOWED-2', 50.0, 10.0)
+                | self._create_move(self.enforced_journal, 'ENFORCED-2', 40.0, 40.0)
+                | self._create_move(self.enforced_journal, 'ENFORCED-3', 30.0, 30.0))
+
+    def test_mixed_balanced(self):
+        moves = self._create_moves()
+        # Only the balance query counts, not reading the journals
+        moves.mapped('journal_id.allow_unbalanced_moves')
+        self.env.user.company_id.currency_id.decimal_places
+        with self.assertQueryCount(1):
+            self.assertTrue(moves.assert_balanced())
+
+    def test_mixed_unbalanced(self):
+        moves = self._create_moves()
+        self._unbalance(moves[1], 5.0)
+        self._unbalance(moves[4], 2.5)
+        with self.assertRaises(UserError) as error:
+            moves.assert_balanced()
+        message = error.exception.name
+        self.assertIn('ENFORCED-1', message)
+        self.assertIn('ENFORCED-3', message)
+        self.assertNotIn('ENFORCED-2', message)
+        self.assertNotIn('ALLOWED', message)
@@ -14,6 +14,11 @@
         'security/ir.model.access.csv',
         #'data/account.tax.csv',
         'views/account_invoice_view.xml',
+        'views/invoice_validation_job_view.xml',
+        'views/discount_recompute_view.xml',
+        'views/discount_rule_view.xml',
+        'data/ir_cron.xml',
+        'data/instrumentation.xml',
         #'views/account_tax_view.xml',
     ],
     'installable': True,
@@ -0,0 +1,133 @@
+# -*- encoding: utf-8 -*-
+import csv
+import io
+import tempfile
+
+from werkzeug.exceptions import BadRequest
+
+import odoo
+from odoo import fields, http
+from odoo.http import request, content_disposition
+
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+EXPORT_COLUMNS = [
+    'Factura', 'Fecha', 'Tipo de factura', 'Empresa', 'NIF', 'Secuencia',
+    'Tipo', 'Modo de calculo', 'Descripción', 'Cuenta', 'Nombre de cuenta',
+    'Desc (%)', 'Precio', 'Cantidad', 'Subtotal', 'Total',
+    'Importe en moneda de la compañía', 'Moneda', 'Impuestos',
+]
+
+EXPORT_QUERY = """
+    DECLARE discount_lines_export NO SCROLL CURSOR FOR
+    SELECT i.number, i.date_invoice, i.type, p.name, p.vat, d.sequence,
+           d.compute_type, d.compute_mode, d.name, a.code, a.name,
+           d.discount, d.price_unit, d.quantity, d.price_subtotal, d.price_total,
+           d.price_subtotal_signed, c.name,
+           (SELECT string_agg(t.name, ', ' ORDER BY t.sequence, t.id)
+              FROM account_invoice_line_discount_tax r
+              JOIN account_tax t ON t.id = r.tax_id
+             WHERE r.invoice_line_discount_id = d.id)
+    FROM account_invoice_line_discounts d
+    JOIN account_invoice i ON i.id = d.invoice_id
+    LEFT JOIN res_partner p ON p.id = i.partner_id
+    LEFT JOIN account_account a ON a.id = d.account_id
+    LEFT JOIN res_currency c ON c.id = d.currency_id
+    WHERE d.company_id IN %(company_ids)s
+      AND (%(date_from)s IS NULL OR i.date_invoice >= %(date_from)s::date)
+      AND (%(date_to)s IS NULL OR i.date_invoice <= %(date_to)s::date)
+    ORDER BY d.id
+"""
+
+
+def _fetch_batches(dbname, params, batch_size):
+    """ Yields the export rows in batches from a server side cursor opened in
+    its own transaction: the request cursor is closed once the response
+    starts streaming. """
+    with odoo.registry(dbname).cursor() as cr:
+        cr.execute(EXPORT_QUERY, params)
+        while True:
+            cr.execute("FETCH FORWARD %s FROM discount_lines_export", (batch_size,))
+            rows = cr.fetchall()
+            if not rows:
+                break
+            yield rows
+        cr.execute("CLOSE discount_lines_export")
+
+
+def _stream_csv(batches):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buf.getvalue().encode('utf-8')
+        buf.seek(0)
+        buf.truncate()
+    yield buf.getvalue().encode('utf-8')
+
+
+def _stream_xlsx(batches):
+    # Unlike the CSV, the xlsx file is not streamed while it is built: a zip
+    # can only be sent once complete. constant_memory mode keeps memory flat
+    # by flushing every row to temporary files, and the finished workbook is
+    # then sent from a temporary file in chunks.
+    with tempfile.TemporaryFile() as tmp:
+        workbook = xlsxwriter.Workbook(tmp, {'constant_memory': True, 'in_memory': False})
+        sheet = workbook.add_worksheet('Descuentos-Cargos')
+        sheet.write_row(0, 0, EXPORT_COLUMNS)
+        row_index = 1
+        for rows in batches:
+            for row in rows:
+                sheet.write_row(row_index, 0, [str(value) if hasattr(value, 'isoformat') else value for value in row])
+                row_index += 1
+        workbook.close()
+        tmp.seek(0)
+        while True:
+            data = tmp.read(64 * 1024)
+            if not data:
+                break
+            yield data
+
+
+class DiscountLinesExport(http.Controller):
+
+    @http.route('/account_extra_discounts/discount_lines/export', type='http', auth='user')
+    def export_discount_lines(self, date_from=None, date_to=None, company_id=None, fmt='csv', batch_size=5000, **kw):
+        user = request.env.user
+        if not user.has_group('account.group_account_invoice'):
+            return request.not_found()
+        if fmt not in ('csv', 'xlsx'):
+            raise BadRequest('Invalid format: %s' % fmt)
+        try:
+            company_id = company_id and int(company_id)
+            batch_size = max(int(batch_size), 1)
+            date_from = date_from and fields.Date.to_date(date_from) or None
+            date_to = date_to and fields.Date.to_date(date_to) or None
+        except ValueError as e:
+            raise BadRequest(str(e))
+        company_ids = user.company_ids.ids
+        if company_id:
+            company_ids = [cid for cid in company_ids if cid == company_id]
+        if not company_ids:
+            return request.not_found()
+        params = {
+            'company_ids': tuple(company_ids),
+            'date_from': date_from,
+            'date_to': date_to,
+        }
+        batches = _fetch_batches(request.env.cr.dbname, params, batch_size)
+        if fmt == 'xlsx' and xlsxwriter:
+            body = _stream_xlsx(batches)
+            mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        else:
+            fmt = 'csv'
+            body = _stream_csv(batches)
+            mimetype = 'text/csv'
+        return request.make_response(body, headers=[
+            ('Content-Type', mimetype),
+            ('Content-Disposition', content_disposition('descuentos_cargos.%s' % fmt)),
+        ])
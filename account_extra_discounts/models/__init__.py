@@ -1,2 +1,13 @@
 # -*- coding: utf-8 -*-
 from . import account_line_discunts
+from . import invoice_validation_job
+from . import product
+from . import account_journal
+from . import discount_recompute
+from . import discount_rule
+from . import sequence_block
+from . import discount_totals
+from . import invoice_refund
+from . import discount_tax_detail
+from . import instrumentation_summary
+from . import discount_line_refresh
@@ -0,0 +1,21 @@
+# -*- encoding: utf-8 -*-
+
+from odoo import fields, models, _
+
+
+class AccountJournal(models.Model):
+    _inherit = 'account.journal'
+
+    group_discount_move_lines = fields.Boolean(
+        string=_('Group Discount/Charge Lines'),
+        help="Post a single journal item per account, taxes, analytic account, "
+             "analytic tags and sign for the discount and charge lines of the invoices.",
+    )
+
+    sequence_block_size = fields.Integer(
+        string=_('Reserved Sequence Block'),
+        help="Number of entry numbers reserved at once for this journal when its "
+             "sequence is gapless, so concurrent posting only locks the sequence "
+             "once per block. Numbers of failed posts are reused later, so they "
+             "may be posted after higher ones. Zero numbers every entry from the sequence.",
+    )
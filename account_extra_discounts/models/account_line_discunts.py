@@ -1,31 +1,67 @@
 # -*- encoding: utf-8 -*-
+import logging
+from collections import Counter
 
-from odoo import fields, models, api, exceptions, _
+from odoo import fields, models, api, exceptions, tools, _
+from odoo.exceptions import UserError
+from odoo.tools import float_compare
 from odoo.addons import decimal_precision as dp
 from odoo.addons.account.models.account_invoice import AccountInvoice
 
+from .discount_cascade import compute_cascade
+from . import instrumentation
+from .instrumentation import instrumented
+from .tax_cache import TaxComputeCache, TAX_CACHE_STATS, TAX_LINE_STATES
+
+_logger = logging.getLogger(__name__)
+
+
+def _add_tax_value(tax_grouped, key, val, round_curr, sign=1):
+    if key not in tax_grouped:
+        tax_grouped[key] = dict(val)
+        tax_grouped[key]['base'] = round_curr(val['base'])
+    else:
+        tax_grouped[key]['amount'] += sign * val['amount']
+        tax_grouped[key]['base'] += sign * round_curr(val['base'])
+
+
+def _convert_with_rates(rates, from_currency, amount, to_currency, company, date):
+    """Same as ``res.currency._convert`` but fetching the conversion rate only
+    once per (currency, company, date) group in ``rates``."""
+    if from_currency == to_currency:
+        return to_currency.round(amount)
+    key = (from_currency.id, to_currency.id, company.id, date)
+    if key not in rates:
+        rates[key] = from_currency._get_conversion_rate(from_currency, to_currency, company, date)
+    return to_currency.round(amount * rates[key])
+
 
 class AccountInvoiceLineDiscounts(models.Model):
     _name = 'account.invoice.line.discounts'
 
-    @api.one
+    @instrumented('account.invoice.line.discounts._compute_price')
+    @api.multi
     @api.depends('price_unit', 'discount', 'invoice_line_tax_ids', 'quantity',
         'product_id', 'invoice_id.partner_id', 'invoice_id.currency_id', 'invoice_id.company_id',
         'invoice_id.date_invoice', 'invoice_id.date')
     def _compute_price(self):
-        currency = self.invoice_id and self.invoice_id.currency_id or None
-        price = self.price_unit #* (1 - (self.discount or 0.0) / 100.0)
-        taxes = False
-        if self.invoice_line_tax_ids:
-            taxes = self.invoice_line_tax_ids.compute_all(price, currency, self.quantity, product=self.product_id, partner=self.invoice_id.partner_id)
-        self.price_subtotal = price_subtotal_signed = taxes['total_excluded'] if taxes else self.quantity * price
-        self.price_total = taxes['total_included'] if taxes else self.price_subtotal
-        if self.invoice_id.currency_id and self.invoice_id.currency_id != self.invoice_id.company_id.currency_id:
-            currency = self.invoice_id.currency_id
-            date = self.invoice_id._get_currency_rate_date()
-            price_subtotal_signed = currency._convert(price_subtotal_signed, self.invoice_id.company_id.currency_id, self.company_id or self.env.user.company_id, date or fields.Date.today())
-        sign = self.invoice_id.type in ['in_refund', 'out_refund'] and -1 or 1
-        self.price_subtotal_signed = price_subtotal_signed * sign
+        rates = {}
+        for line in self:
+            invoice = line.invoice_id
+            currency = invoice and invoice.currency_id or None
+            price = line.price_unit #* (1 - (line.discount or 0.0) / 100.0)
+            taxes = False
+            if line.invoice_line_tax_ids:
+                taxes = line.invoice_line_tax_ids.compute_all(price, currency, line.quantity, product=line.product_id, partner=invoice.partner_id)
+            line.price_subtotal = price_subtotal_signed = taxes['total_excluded'] if taxes else line.quantity * price
+            line.price_total = taxes['total_included'] if taxes else line.price_subtotal
+            if invoice.currency_id and invoice.currency_id != invoice.company_id.currency_id:
+                date = invoice._get_currency_rate_date()
+                price_subtotal_signed = _convert_with_rates(
+                    rates, invoice.currency_id, price_subtotal_signed, invoice.company_id.currency_id,
+                    line.company_id or self.env.user.company_id, date or fields.Date.today())
+            sign = invoice.type in ['in_refund', 'out_refund'] and -1 or 1
+            line.price_subtotal_signed = price_subtotal_signed * sign
 
     @api.model
     def _default_account(self):
@@ -125,30 +161,72 @@ class AccountInvoiceLineDiscounts(models.Model):
             if company.currency_id != currency:
                 self.price_unit = self.price_unit * currency.with_context(dict(self._context or {}, date=self.invoice_id.date_invoice)).rate
 
+    @api.model
+    @tools.ormcache('product_id', 'fpos_id', 'company_id', 'inv_type', 'lang')
+    def _get_product_values(self, product_id, fpos_id, company_id, inv_type, lang):
+        """ Account, taxes, name and unit of measure of a discount product.
+        Cached per registry; the cache is cleared when the fields they are
+        computed from change (see product.py). Prices are read live.
+        """
+        # Company dependent accounts are read in the company of the key
+        product = self.env['product.product'].with_context(lang=lang, force_company=company_id).browse(product_id)
+        fpos = self.env['account.fiscal.position'].browse(fpos_id)
+        company = self.env['res.company'].browse(company_id)
+        account = self.get_invoice_line_account(inv_type, product, fpos, company)
+
+        # Keep only taxes of the company
+        if inv_type in ('out_invoice', 'out_refund'):
+            taxes = product.taxes_id.filtered(lambda r: r.company_id == company)
+        else:
+            taxes = product.supplier_taxes_id.filtered(lambda r: r.company_id == company)
+        # map_tax only depends on the partner through overrides; the invoice
+        # partner is not part of the key
+        fp_taxes = taxes and fpos.map_tax(taxes, product)
+        return (
+            account.id,
+            tuple(taxes.ids),
+            tuple(fp_taxes and fp_taxes.ids or ()),
+            self._get_product_invoice_name(product, inv_type),
+            product.uom_id.id,
+            product.uom_id.category_id.id,
+        )
+
+    def _get_line_product_values(self):
+        self.ensure_one()
+        invoice = self.invoice_id
+        company = invoice.company_id or self.env.user.company_id
+        return self._get_product_values(
+            self.product_id.id, invoice.fiscal_position_id.id, company.id,
+            invoice.type, invoice.partner_id.lang or self.env.lang)
+
     def _set_taxes(self):
         """ Used in on_change to set taxes and price"""
         self.ensure_one()
+        account_id, tax_ids, fp_tax_ids, name, uom_id, uom_category_id = self._get_line_product_values()
+        Tax = self.env['account.tax']
 
-        # Keep only taxes of the company
-        company_id = self.company_id or self.env.user.company_id
-
-        if self.invoice_id.type in ('out_invoice', 'out_refund'):
-            taxes = self.product_id.taxes_id.filtered(lambda r: r.company_id == company_id) or self.account_id.tax_ids or self.invoice_id.company_id.account_sale_tax_id
+        if tax_ids:
+            taxes = Tax.browse(tax_ids)
+            self.invoice_line_tax_ids = fp_taxes = Tax.browse(fp_tax_ids)
         else:
-            taxes = self.product_id.supplier_taxes_id.filtered(lambda r: r.company_id == company_id) or self.account_id.tax_ids or self.invoice_id.company_id.account_purchase_tax_id
-
-        self.invoice_line_tax_ids = fp_taxes = self.invoice_id.fiscal_position_id.map_tax(taxes, self.product_id, self.invoice_id.partner_id)
+            if self.invoice_id.type in ('out_invoice', 'out_refund'):
+                taxes = self.account_id.tax_ids or self.invoice_id.company_id.account_sale_tax_id
+            else:
+                taxes = self.account_id.tax_ids or self.invoice_id.company_id.account_purchase_tax_id
+            self.invoice_line_tax_ids = fp_taxes = self.invoice_id.fiscal_position_id.map_tax(taxes, self.product_id, self.invoice_id.partner_id)
 
-        fix_price = self.env['account.tax']._fix_tax_included_price
+        fix_price = Tax._fix_tax_included_price
         if self.invoice_id.type in ('in_invoice', 'in_refund'):
             prec = self.env['decimal.precision'].precision_get('Product Price')
-            if not self.price_unit or float_compare(self.price_unit, self.product_id.standard_price, precision_digits=prec) == 0:
-                self.price_unit = fix_price(self.product_id.standard_price, taxes, fp_taxes)
+            standard_price = self.product_id.standard_price
+            if not self.price_unit or float_compare(self.price_unit, standard_price, precision_digits=prec) == 0:
+                self.price_unit = fix_price(standard_price, taxes, fp_taxes)
                 self._set_currency()
         else:
             self.price_unit = fix_price(self.product_id.lst_price, taxes, fp_taxes)
             self._set_currency()
 
+    @instrumented('account.invoice.line.discounts._onchange_product_id')
     @api.onchange('product_id')
     def _onchange_product_id(self):
         domain = {}
@@ -156,7 +234,6 @@ class AccountInvoiceLineDiscounts(models.Model):
             return
 
         part = self.invoice_id.partner_id
-        fpos = self.invoice_id.fiscal_position_id
         company = self.invoice_id.company_id
         currency = self.invoice_id.currency_id
         type = self.invoice_id.type
@@ -173,28 +250,22 @@ class AccountInvoiceLineDiscounts(models.Model):
                 self.price_unit = 0.0
             domain['uom_id'] = []
         else:
-            self_lang = self
-            if part.lang:
-                self_lang = self.with_context(lang=part.lang)
-
-            product = self_lang.product_id
-            account = self.get_invoice_line_account(type, product, fpos, company)
-            if account:
-                self.account_id = account.id
+            account_id, tax_ids, fp_tax_ids, product_name, uom_id, uom_category_id = self._get_line_product_values()
+            if account_id:
+                self.account_id = account_id
             self._set_taxes()
 
-            product_name = self_lang._get_invoice_line_name_from_product()
             if product_name != None:
                 self.name = product_name
 
-            if not self.uom_id or product.uom_id.category_id.id != self.uom_id.category_id.id:
-                self.uom_id = product.uom_id.id
-            domain['uom_id'] = [('category_id', '=', product.uom_id.category_id.id)]
+            if not self.uom_id or uom_category_id != self.uom_id.category_id.id:
+                self.uom_id = uom_id
+            domain['uom_id'] = [('category_id', '=', uom_category_id)]
 
             if company and currency:
 
-                if self.uom_id and self.uom_id.id != product.uom_id.id:
-                    self.price_unit = product.uom_id._compute_price(self.price_unit, self.uom_id)
+                if self.uom_id and self.uom_id.id != uom_id:
+                    self.price_unit = self.product_id.uom_id._compute_price(self.price_unit, self.uom_id)
         return {'domain': domain}
 
     def _get_invoice_line_name_from_product(self):
@@ -202,130 +273,22 @@ class AccountInvoiceLineDiscounts(models.Model):
         the product it is linked to.
         """
         self.ensure_one()
-        if not self.product_id:
+        return self._get_product_invoice_name(self.product_id, self.invoice_id.type)
+
+    @api.model
+    def _get_product_invoice_name(self, product, invoice_type):
+        if not product:
             return ''
-        invoice_type = self.invoice_id.type
-        rslt = self.product_id.partner_ref
+        rslt = product.partner_ref
         if invoice_type in ('in_invoice', 'in_refund'):
-            if self.product_id.description_purchase:
-                rslt += '\n' + self.product_id.description_purchase
+            if product.description_purchase:
+                rslt += '\n' + product.description_purchase
         else:
-            if self.product_id.description_sale:
-                rslt += '\n' + self.product_id.description_sale
+            if product.description_sale:
+                rslt += '\n' + product.description_sale
 
         return rslt
 
-    @api.onchange('discount','price_unit')
-    def onchange_discount(self):
-        # Subtotal de lineas
-        amount_untaxed_lines = sum(line.price_subtotal for line in self.invoice_id.invoice_line_ids)
-        account_invoice_line_discount_ids = self.invoice_id.account_invoice_line_discount_ids
-        print(account_invoice_line_discount_ids)
-        for line_dis in account_invoice_line_discount_ids.sorted(key =lambda x:x.sequence):
-            if line_dis.compute_type == 'charge':
-                round_curr = line_dis.currency_id.round
-                if line_dis.compute_mode == 'percent':
-                    amount_discount = amount_untaxed_lines * (line_dis.discount/100.0)
-                    line_dis.price_unit = amount_discount
-                    line_dis.update({
-                        'price_unit':amount_discount
-                    })
-                else:
-                    amount_discount = line_dis.price_unit
-                    line_dis.price_unit = amount_discount
-                    line_dis.update({
-                        'price_unit':amount_discount
-                    })
-                amount_untaxed_lines +=line_dis.price_subtotal
-                continue
-            elif line_dis.compute_type == 'discount':
-                round_curr = line_dis.currency_id.round
-                if line_dis.compute_mode == 'percent':
-                    amount_discount = amount_untaxed_lines * (line_dis.discount/100.0)
-                    line_dis.price_unit = amount_discount
-                    line_dis.update({
-                        'price_unit':amount_discount
-                    })
-                else:
-                    amount_discount = line_dis.price_unit
-                    line_dis.price_unit = amount_discount
-                    line_dis.update({
-                        'price_unit':amount_discount
-                    })
-                amount_untaxed_lines -=line_dis.price_subtotal
-                continue
-
-
-
-
-        # account_invoice_line_discount_ids = self.invoice_id.account_invoice_line_discount_ids.filtered(
-        #     lambda x: x.compute_type == 'charge'
-        # )
-        # for line_dis in account_invoice_line_discount_ids.sorted(key =lambda x:x.sequence):
-        #     print(line_dis)
-        #     round_curr = line_dis.currency_id.round
-        #     if line_dis.compute_mode == 'percent':
-        #         amount_discount = amount_untaxed_lines * (line_dis.discount/100.0)
-        #     else:
-        #         amount_discount = line_dis.price_unit
-        #     line_dis.price_unit = amount_discount
-        #     line_dis.update({
-        #         'price_unit':amount_discount
-        #     })
-        #     amount_untaxed_lines +=amount_discount
-        
-
-
-
-        # # print(amount_untaxed_lines)
-        # # Añadir los cargos extras.
-        # # amount_untaxed_lines += sum(line.price_subtotal if line.compute_type == 'charge' else 0.0 for line in self.invoice_id.account_invoice_line_discount_ids )
-        # # print(amount_untaxed_lines)
-        # account_invoice_line_discount_ids = self.invoice_id.account_invoice_line_discount_ids.filtered(
-        #     lambda x: x.compute_type == 'discount'
-        # ) #x.sequence < self.sequence and
-        # print(account_invoice_line_discount_ids)
-
-        # for line_dis in account_invoice_line_discount_ids.sorted(key =lambda x:x.sequence):
-        #     print(line_dis)
-        #     round_curr = line_dis.currency_id.round
-        #     if line_dis.compute_mode == 'percent':
-        #         amount_discount = amount_untaxed_lines * (line_dis.discount/100.0)
-        #     else:
-        #         amount_discount = line_dis.price_unit
-        #     line_dis.price_unit = amount_discount
-        #     line_dis.update({
-        #         'price_unit':amount_discount
-        #     })
-        #     amount_untaxed_lines -=amount_discount
-
-
-
-        # if account_invoice_line_discount_ids:
-        #     amount_untaxed_lines -= sum(line.price_subtotal for line in account_invoice_line_discount_ids )
-        # #print(amount_untaxed_lines)
-        # #amount_untaxed_lines = self.invoice_id.amount_untaxed
-        # print(self)
-        # for inv_line in self:
-        #     if inv_line.compute_type == 'discount':
-        #         #amount_untaxed_lines += inv_line.price_subtotal
-        #         #print(amount_untaxed_lines)
-        #         round_curr = inv_line.currency_id.round
-        #         amount_discount = amount_untaxed_lines * (inv_line.discount/100.0)
-        #         inv_line.price_unit = amount_discount
-        #         inv_line.update({
-        #             'price_unit':amount_discount
-        #         })
-                #amount_untaxed_lines -= amount_discount
-        #print("End")
-
-def _execute_onchanges_discounts(records, field_name):
-    """Helper methods that executes all onchanges associated to a field."""
-    for onchange in records._onchange_methods.get(field_name, []):
-        for record in records:
-            record._origin = record.env['account.invoice.line.discounts']
-            onchange(record)
-
 class AccountInvoiceInherit(models.Model):
     _inherit = 'account.invoice'
 
@@ -334,6 +297,39 @@ class AccountInvoiceInherit(models.Model):
         inverse_name='invoice_id',
     )
 
+    amount_charges = fields.Monetary(
+        string='Total cargos',
+        compute='_compute_discount_totals',
+        store=True,
+        index=True,
+        readonly=True,
+    )
+
+    amount_discounts = fields.Monetary(
+        string='Total descuentos',
+        compute='_compute_discount_totals',
+        store=True,
+        index=True,
+        readonly=True,
+    )
+
+    discount_line_count = fields.Integer(
+        string='Líneas de descuentos/cargos',
+        compute='_compute_discount_totals',
+        store=True,
+        index=True,
+        readonly=True,
+    )
+
+    @api.multi
+    @api.depends('account_invoice_line_discount_ids.price_subtotal',
+                 'account_invoice_line_discount_ids.compute_type')
+    def _compute_discount_totals(self):
+        for invoice in self:
+            lines = invoice.account_invoice_line_discount_ids
+            invoice.amount_charges = sum(lines.filtered(lambda l: l.compute_type == 'charge').mapped('price_subtotal'))
+            invoice.amount_discounts = sum(lines.filtered(lambda l: l.compute_type == 'discount').mapped('price_subtotal'))
+            invoice.discount_line_count = len(lines)
 
 
     # @api.onchange('account_invoice_line_discount_ids')
@@ -354,17 +350,102 @@ class AccountInvoiceInherit(models.Model):
     #                 'price_unit':amount_discount
     #             })
     #             amount_untaxed_lines -= amount_discount
-    @api.onchange('invoice_line_ids','account_invoice_line_discount_ids')
-    def _onchange_invoice_discounts_line_ids(self):
-        DiscLines = self.env['account.invoice.line.discounts']
-        for line in self.account_invoice_line_discount_ids:
-            if line.compute_type == 'discount':
-                _execute_onchanges_discounts(line, 'discount')
-            else:
-                _execute_onchanges_discounts(line, 'price_unit')
+    def _get_discount_cascade(self, base_amount=None):
+        """ Runs the discount/charge cascade of the invoice in a single pass.
+        Returns the discount lines and, in the same order, their
+        (price_unit, subtotal) pairs plus the resulting untaxed amount.
+        ``base_amount`` defaults to the subtotal of the invoice lines.
+        """
+        self.ensure_one()
+        lines = self.account_invoice_line_discount_ids
+        if base_amount is None:
+            base_amount = sum(line.price_subtotal for line in self.invoice_line_ids)
+        cache = TaxComputeCache(self.env)
+
+        def get_subtotal(index, price_unit, quantity):
+            # Same untaxed amount as the stored price_subtotal of the line
+            line = lines[index]
+            if not line.invoice_line_tax_ids:
+                return quantity * price_unit
+            return cache.compute_all(line.invoice_line_tax_ids, price_unit, self.currency_id,
+                                     quantity, line.product_id, self.partner_id)['total_excluded']
+
+        results, amount_untaxed = compute_cascade(base_amount, [
+            (line.sequence, line.compute_type, line.compute_mode,
+             line.discount if line.compute_mode == 'percent' else line.price_unit,
+             line.quantity)
+            for line in lines
+        ], round_curr=self.currency_id and self.currency_id.round or None, get_subtotal=get_subtotal)
+        return lines, results, amount_untaxed
+
+    def _apply_discount_cascade(self):
+        """ Writes the prices of the percent lines given by the cascade, one
+        write per price and a single recompute. The per line hooks on totals
+        and tax details are skipped: callers recompute the whole invoice. """
+        prices = {}
+        for invoice in self:
+            lines, results, amount_untaxed = invoice._get_discount_cascade()
+            for line, (price_unit, subtotal) in zip(lines, results):
+                if line.compute_mode == 'percent' and line.price_unit != price_unit:
+                    prices.setdefault(price_unit, []).append(line.id)
+        if not prices:
+            return
+        Lines = self.env['account.invoice.line.discounts'].with_context(skip_discount_line_hooks=True)
+        with self.env.norecompute():
+            for price_unit, line_ids in prices.items():
+                Lines.browse(line_ids).write({'price_unit': price_unit})
+        self.recompute()
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        if self.env.context.get('skip_discount_refresh'):
+            return super(AccountInvoiceInherit, self).create(vals_list)
+        # The discount lines are refreshed as a whole once created
+        Invoice = self
+        if all(vals.get('state', 'draft') == 'draft' for vals in vals_list):
+            Invoice = self.with_context(skip_discount_line_hooks=True)
+        invoices = super(AccountInvoiceInherit, Invoice).create(vals_list).with_env(self.env)
+        invoices.filtered('account_invoice_line_discount_ids')._refresh_discounts()
+        return invoices
+
+    @api.multi
+    def write(self, vals):
+        if self.env.context.get('skip_discount_refresh'):
+            return super(AccountInvoiceInherit, self).write(vals)
+        records = self
+        if 'account_invoice_line_discount_ids' in vals and all(inv.state == 'draft' for inv in self):
+            records = self.with_context(skip_discount_line_hooks=True)
+        res = super(AccountInvoiceInherit, records).write(vals)
+        if 'account_invoice_line_discount_ids' in vals:
+            # Also when the last discount line was removed, to drop its taxes
+            self._refresh_discounts()
+        elif vals.get('invoice_line_ids'):
+            self.filtered('discount_line_count')._refresh_discounts()
+        return res
 
-    @api.onchange('invoice_line_ids','account_invoice_line_discount_ids')
+    @api.multi
+    def _refresh_discounts(self):
+        """ Applies the discount cascade and recomputes taxes and totals of
+        the draft invoices from their stored lines. The invoice form does not
+        do it on every change of the discount lines, which are loaded page by
+        page, but once they are saved. """
+        invoices = self.filtered(lambda inv: inv.state == 'draft').with_context(skip_discount_refresh=True)
+        if not invoices:
+            return
+        invoices._apply_discount_cascade()
+        invoices.compute_taxes()
+        invoices._recompute_discount_totals()
+
+    @api.multi
+    def action_refresh_discounts(self):
+        self._refresh_discounts()
+
+    @instrumented('account.invoice._onchange_invoice_line_ids')
+    @api.onchange('invoice_line_ids')
     def _onchange_invoice_line_ids(self):
+        if self.env['ir.config_parameter'].sudo().get_param('account_extra_discounts.incremental_taxes'):
+            self._update_tax_lines(self._get_taxes_values_incremental())
+            return
         taxes_grouped = self.get_taxes_values()
         tax_lines = self.tax_line_ids.filtered('manual')
         for tax in taxes_grouped.values():
@@ -373,32 +454,32 @@ class AccountInvoiceInherit(models.Model):
         return
 
     #'account_invoice_line_discount_ids.price_subtotal',
-    @api.one
+    @instrumented('account.invoice._compute_amount')
+    @api.multi
     @api.depends('invoice_line_ids.price_subtotal', 'tax_line_ids.amount', 'tax_line_ids.amount_rounding',
                  'currency_id', 'company_id', 'date_invoice', 'type')
     def _compute_amount_new(self):
-        round_curr = self.currency_id.round
-        amount_untaxed = sum(line.price_subtotal for line in self.invoice_line_ids)
-        for lin_dis in self.account_invoice_line_discount_ids:
-            if lin_dis.compute_type == 'discount':
-                amount_untaxed -= lin_dis.price_subtotal
-            elif lin_dis.compute_type == 'charge':
-                amount_untaxed += lin_dis.price_subtotal
-
-
-        self.amount_untaxed = amount_untaxed
-        self.amount_tax = sum(round_curr(line.amount_total) for line in self.tax_line_ids)
-        self.amount_total = self.amount_untaxed + self.amount_tax
-        amount_total_company_signed = self.amount_total
-        amount_untaxed_signed = self.amount_untaxed
-        if self.currency_id and self.company_id and self.currency_id != self.company_id.currency_id:
-            currency_id = self.currency_id
-            amount_total_company_signed = currency_id._convert(self.amount_total, self.company_id.currency_id, self.company_id, self.date_invoice or fields.Date.today())
-            amount_untaxed_signed = currency_id._convert(self.amount_untaxed, self.company_id.currency_id, self.company_id, self.date_invoice or fields.Date.today())
-        sign = self.type in ['in_refund', 'out_refund'] and -1 or 1
-        self.amount_total_company_signed = amount_total_company_signed * sign
-        self.amount_total_signed = self.amount_total * sign
-        self.amount_untaxed_signed = amount_untaxed_signed * sign
+        # Prefetch the lines of the whole batch at once
+        self.mapped('invoice_line_ids.price_subtotal')
+        self.mapped('account_invoice_line_discount_ids.price_unit')
+        self.mapped('tax_line_ids.amount_total')
+        rates = {}
+        for invoice in self:
+            round_curr = invoice.currency_id.round
+            invoice.amount_untaxed = invoice._get_discount_cascade()[2]
+            invoice.amount_tax = sum(round_curr(line.amount_total) for line in invoice.tax_line_ids)
+            invoice.amount_total = invoice.amount_untaxed + invoice.amount_tax
+            amount_total_company_signed = invoice.amount_total
+            amount_untaxed_signed = invoice.amount_untaxed
+            if invoice.currency_id and invoice.company_id and invoice.currency_id != invoice.company_id.currency_id:
+                currency_id = invoice.currency_id
+                date = invoice.date_invoice or fields.Date.today()
+                amount_total_company_signed = _convert_with_rates(rates, currency_id, invoice.amount_total, invoice.company_id.currency_id, invoice.company_id, date)
+                amount_untaxed_signed = _convert_with_rates(rates, currency_id, invoice.amount_untaxed, invoice.company_id.currency_id, invoice.company_id, date)
+            sign = invoice.type in ['in_refund', 'out_refund'] and -1 or 1
+            invoice.amount_total_company_signed = amount_total_company_signed * sign
+            invoice.amount_total_signed = invoice.amount_total * sign
+            invoice.amount_untaxed_signed = amount_untaxed_signed * sign
 
     # def _compute_sign_taxes_new(self):
     #     for invoice in self:
@@ -409,52 +490,203 @@ class AccountInvoiceInherit(models.Model):
     AccountInvoice._compute_amount_old = AccountInvoice._compute_amount
     AccountInvoice._compute_amount = _compute_amount_new
 
+    @instrumented('account.invoice.get_taxes_values')
     @api.multi
     def get_taxes_values_new(self):
         tax_grouped = {}
         round_curr = self.currency_id.round
+        cache = TaxComputeCache(self.env)
+        for signature, line, price_unit in self._get_tax_sources():
+            for key, val in self._get_line_tax_values(line, price_unit, cache):
+                _add_tax_value(tax_grouped, key, val, round_curr)
+        cache.flush_stats()
+        return tax_grouped
+
+    def _get_tax_sources(self):
+        """ Returns a (signature, line, price_unit) tuple for every invoice and
+        discount line generating taxes. Lines with the same signature produce
+        the same tax values.
+        """
+        sources = []
         for line in self.invoice_line_ids:
             if not line.account_id:
                 continue
             price_unit = line.price_unit * (1 - (line.discount or 0.0) / 100.0)
-            taxes = line.invoice_line_tax_ids.compute_all(price_unit, self.currency_id, line.quantity, line.product_id, self.partner_id)['taxes']
-            for tax in taxes:
-                val = self._prepare_tax_line_vals(line, tax)
-                key = self.env['account.tax'].browse(tax['id']).get_grouping_key(val)
-
-                if key not in tax_grouped:
-                    tax_grouped[key] = val
-                    tax_grouped[key]['base'] = round_curr(val['base'])
-                else:
-                    tax_grouped[key]['amount'] += val['amount']
-                    tax_grouped[key]['base'] += round_curr(val['base'])
+            sources.append((self._get_tax_signature(line, price_unit), line, price_unit))
 
-        for line_dic in self.account_invoice_line_discount_ids:
+        lines, results, amount_untaxed = self._get_discount_cascade()
+        for line_dic, (price_unit, subtotal) in zip(lines, results):
             if not line_dic.account_id:
                 continue
-            price_unit = line_dic.price_unit
             if line_dic.compute_type == 'discount':
                 price_unit = -price_unit
-            taxes = line_dic.invoice_line_tax_ids.compute_all(price_unit, self.currency_id, line_dic.quantity, line_dic.product_id, self.partner_id)['taxes']
-            for tax in taxes:
-                val = self._prepare_tax_line_vals(line_dic, tax)
-                key = self.env['account.tax'].browse(tax['id']).get_grouping_key(val)
-                #print(val)
-                #input("lo de los ivas")
-                if key not in tax_grouped:
-                    tax_grouped[key] = val
-                    tax_grouped[key]['base'] = round_curr(val['base'])
-                else:
-                    tax_grouped[key]['amount'] += val['amount']
-                    tax_grouped[key]['base'] += round_curr(val['base'])
-        #print(tax_grouped)
-        #input("osnddvos")
+            sources.append((self._get_tax_signature(line_dic, price_unit), line_dic, price_unit))
+        return sources
+
+    def _get_tax_signature(self, line, price_unit):
+        # The write date of the taxes makes a line computed with an older
+        # version of a tax a different signature, in every worker
+        taxes = line.invoice_line_tax_ids
+        taxes_version = tuple((tax.id, tax.write_date) for tax in taxes | taxes.mapped('children_tax_ids'))
+        return (taxes_version, price_unit, line.quantity,
+                line.product_id.id, self.partner_id.id, self.currency_id.id, self.type,
+                line.account_id.id, line.account_analytic_id.id, tuple(line.analytic_tag_ids.ids))
+
+    def _get_line_tax_values(self, line, price_unit, cache):
+        taxes = cache.compute_all(line.invoice_line_tax_ids, price_unit, self.currency_id, line.quantity, line.product_id, self.partner_id)['taxes']
+        res = []
+        for tax in taxes:
+            val = self._prepare_tax_line_vals(line, tax)
+            res.append((cache.grouping_key(tax['id'], val), val))
+        return res
+
+    def _get_taxes_values_incremental(self):
+        """ Same result as get_taxes_values, but starting from the tax values
+        computed in the previous call for this invoice: only the lines whose
+        signature appeared or disappeared since then are added or subtracted.
+        """
+        self.ensure_one()
+        round_curr = self.currency_id.round
+        cache = TaxComputeCache(self.env)
+        invoice_id = self._get_origin_id()
+        state_key = (self.env.cr.dbname, invoice_id)
+        previous = invoice_id and TAX_LINE_STATES.get(state_key)
+        if previous:
+            # Work on a copy, other onchanges of the same invoice may be running
+            state = {
+                'counts': Counter(previous['counts']),
+                'key_counts': Counter(previous['key_counts']),
+                'values': dict(previous['values']),
+                'grouped': {key: dict(val) for key, val in previous['grouped'].items()},
+            }
+        else:
+            state = {'counts': Counter(), 'key_counts': Counter(), 'values': {}, 'grouped': {}}
+
+        counts = Counter()
+        sources = {}
+        for signature, line, price_unit in self._get_tax_sources():
+            counts[signature] += 1
+            sources.setdefault(signature, (line, price_unit))
+
+        grouped = state['grouped']
+        key_counts = state['key_counts']
+        for signature in set(counts) | set(state['counts']):
+            delta = counts[signature] - state['counts'][signature]
+            if not delta:
+                continue
+            if signature not in state['values']:
+                line, price_unit = sources[signature]
+                state['values'][signature] = self._get_line_tax_values(line, price_unit, cache)
+            for key, val in state['values'][signature]:
+                for i in range(abs(delta)):
+                    _add_tax_value(grouped, key, val, round_curr, sign=delta > 0 and 1 or -1)
+                key_counts[key] += delta
+                if not key_counts[key]:
+                    del key_counts[key]
+                    del grouped[key]
+        state['counts'] = counts
+        state['values'] = {sig: vals for sig, vals in state['values'].items() if sig in counts}
+        if invoice_id:
+            TAX_LINE_STATES[state_key] = state
+        cache.flush_stats()
+
+        tax_grouped = {key: dict(val, invoice_id=self.id) for key, val in grouped.items()}
+        if self.env['ir.config_parameter'].sudo().get_param('account_extra_discounts.verify_incremental_taxes'):
+            tax_grouped = self._verify_taxes_values(tax_grouped)
         return tax_grouped
 
+    def _verify_taxes_values(self, tax_grouped):
+        """ Compares the incremental tax values with a full recompute, logs the
+        differences and returns the full recompute. """
+        expected = self.get_taxes_values()
+        currency = self.currency_id
+        for key in set(expected) | set(tax_grouped):
+            exp, got = expected.get(key), tax_grouped.get(key)
+            if not exp or not got or not currency.is_zero(exp['amount'] - got['amount']) \
+                    or not currency.is_zero(exp['base'] - got['base']):
+                _logger.warning("Incremental taxes of invoice %s differ on %s: expected %s, got %s",
+                                self._get_origin_id() or self.id, key,
+                                exp and (exp['base'], exp['amount']), got and (got['base'], got['amount']))
+        return expected
+
+    def _get_origin_id(self):
+        """ Database id of the invoice, also while editing it in an onchange. """
+        if isinstance(self.id, models.NewId):
+            return getattr(self, '_origin', self.browse()).id
+        return self.id
+
+    def _get_tax_line_grouping_key(self, tax_line):
+        tax = tax_line.tax_id
+        return tax.get_grouping_key({
+            'tax_id': tax.id,
+            'account_id': tax_line.account_id.id,
+            'account_analytic_id': tax.analytic and tax_line.account_analytic_id.id or False,
+            'analytic_tag_ids': tax.analytic and tax_line.analytic_tag_ids.ids or False,
+        })
+
+    def _update_tax_lines(self, taxes_grouped):
+        """ Updates the computed tax lines with ``taxes_grouped``, touching
+        only the lines whose amounts changed. """
+        taxes_grouped = dict(taxes_grouped)
+        tax_lines = self.tax_line_ids.filtered('manual')
+        for tax_line in self.tax_line_ids - tax_lines:
+            tax = taxes_grouped.pop(self._get_tax_line_grouping_key(tax_line), None)
+            if not tax:
+                continue
+            if tax_line.amount != tax['amount'] or tax_line.base != tax['base']:
+                tax_line.update({'amount': tax['amount'], 'base': tax['base']})
+            tax_lines += tax_line
+        for tax in taxes_grouped.values():
+            tax_lines += tax_lines.new(tax)
+        self.tax_line_ids = tax_lines
+
+    @api.model
+    def _check_instrumentation_access(self):
+        # The flag is a system parameter shared by every worker
+        if not self.env.user.has_group('base.group_system'):
+            raise exceptions.AccessError(_('Only administrators can switch the discount metrics.'))
+
+    @api.model
+    def action_instrumentation_enable(self):
+        self._check_instrumentation_access()
+        instrumentation.set_enabled(self.env, True)
+
+    @api.model
+    def action_instrumentation_disable(self):
+        self._check_instrumentation_access()
+        instrumentation.set_enabled(self.env, False)
+        instrumentation.reset()
+
+    @api.model
+    def action_instrumentation_summary(self):
+        """ Logs the metrics collected by this worker process and shows them """
+        enabled = instrumentation.is_enabled(self.env)
+        summary = instrumentation.format_summary()
+        _logger.info("Extra discounts instrumentation (%s):\n%s", enabled and 'enabled' or 'disabled', summary)
+        wizard = self.env['account.invoice.discounts.instrumentation.summary'].create({
+            'enabled': enabled,
+            'summary': summary,
+        })
+        return {
+            'name': _('Métricas de descuentos'),
+            'type': 'ir.actions.act_window',
+            'res_model': wizard._name,
+            'res_id': wizard.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+
+    @api.model
+    def get_tax_cache_stats(self):
+        """ Hit/miss counters of the tax computation cache since the worker
+        started. """
+        return dict(TAX_CACHE_STATS)
+
     AccountInvoice.get_taxes_values_old = AccountInvoice.get_taxes_values
     AccountInvoice.get_taxes_values = get_taxes_values_new
 
 
+    @instrumented('account.invoice.invoice_line_discounts_move_line_get')
     @api.model
     def invoice_line_discounts_move_line_get(self):
         res = []
@@ -493,91 +725,137 @@ class AccountInvoiceInherit(models.Model):
                 'invoice_id': self.id,
             }
             res.append(move_line_dict)
+        if self.journal_id.group_discount_move_lines:
+            res = self._group_discount_move_lines(res)
         return res
 
-
+    @api.model
+    def _group_discount_move_lines(self, move_lines):
+        """ Merges the discount/charge move lines sharing account, taxes,
+        analytic account, analytic tags and sign into a single line. """
+        grouped = {}
+        for vals in move_lines:
+            key = (
+                vals['account_id'],
+                tuple(sorted(set(command[1] for command in vals['tax_ids']))),
+                vals['account_analytic_id'],
+                tuple(sorted(command[1] for command in vals['analytic_tag_ids'])),
+                vals['price'] < 0,
+            )
+            if key not in grouped:
+                grouped[key] = dict(vals)
+                continue
+            group = grouped[key]
+            group['price'] += vals['price']
+            group.update({
+                'name': _('Descuentos/Cargos'),
+                'price_unit': group['price'],
+                'quantity': 1.0,
+                'product_id': False,
+                'uom_id': False,
+            })
+        return list(grouped.values())
+
+
+    @instrumented('account.invoice._prepare_invoice_move_vals')
     @api.multi
-    def action_move_create_new(self):
-        """ Creates invoice related analytics and financial move lines """
-        account_move = self.env['account.move']
+    def _prepare_invoice_move_vals(self):
+        """ Builds the values of the account move of the invoice """
+        inv = self
+        company_currency = inv.company_id.currency_id
+
+        # create move lines (one per invoice line + eventual taxes and analytic lines)
+        iml = inv.invoice_line_move_line_get()
+        iml += inv.tax_line_move_line_get()
+        iml += inv.invoice_line_discounts_move_line_get()
+
+        diff_currency = inv.currency_id != company_currency
+        # create one move line for the total and possibly adjust the other lines amount
+        total, total_currency, iml = inv.compute_invoice_totals(company_currency, iml)
+
+        name = inv.name or ''
+        if inv.payment_term_id:
+            totlines = inv.payment_term_id.with_context(currency_id=company_currency.id).compute(total, inv.date_invoice)[0]
+            res_amount_currency = total_currency
+            for i, t in enumerate(totlines):
+                if inv.currency_id != company_currency:
+                    amount_currency = company_currency._convert(t[1], inv.currency_id, inv.company_id, inv._get_currency_rate_date() or fields.Date.today())
+                else:
+                    amount_currency = False
 
+                # last line: add the diff
+                res_amount_currency -= amount_currency or 0
+                if i + 1 == len(totlines):
+                    amount_currency += res_amount_currency
+
+                iml.append({
+                    'type': 'dest',
+                    'name': name,
+                    'price': t[1],
+                    'account_id': inv.account_id.id,
+                    'date_maturity': t[0],
+                    'amount_currency': diff_currency and amount_currency,
+                    'currency_id': diff_currency and inv.currency_id.id,
+                    'invoice_id': inv.id
+                })
+        else:
+            iml.append({
+                'type': 'dest',
+                'name': name,
+                'price': total,
+                'account_id': inv.account_id.id,
+                'date_maturity': inv.date_due,
+                'amount_currency': diff_currency and total_currency,
+                'currency_id': diff_currency and inv.currency_id.id,
+                'invoice_id': inv.id
+            })
+        part = self.env['res.partner']._find_accounting_partner(inv.partner_id)
+        line = [(0, 0, self.line_get_convert(l, part.id)) for l in iml]
+        line = inv.group_lines(iml, line)
+
+        line = inv.finalize_invoice_move_lines(line)
+
+        return {
+            'ref': inv.reference,
+            'line_ids': line,
+            'journal_id': inv.journal_id.id,
+            'date': inv.date or inv.date_invoice,
+            'narration': inv.comment,
+        }
+
+    def _check_invoice_move_create(self):
         for inv in self:
             if not inv.journal_id.sequence_id:
                 raise UserError(_('Please define sequence on the journal related to this invoice.'))
             if not inv.invoice_line_ids.filtered(lambda line: line.account_id):
                 raise UserError(_('Please add at least one invoice line.'))
+
+    def _move_post_needs_invoice(self):
+        """ account.move.post only uses the invoice to reuse the name of a
+        cancelled move or to pick the refund sequence of the journal. """
+        self.ensure_one()
+        return (self.move_name and self.move_name != '/') or \
+            (self.type in ('out_refund', 'in_refund') and self.journal_id.refund_sequence)
+
+    @instrumented('account.invoice.action_move_create')
+    @api.multi
+    def action_move_create_new(self):
+        """ Creates invoice related analytics and financial move lines """
+        if len(self) > 1:
+            return self._action_move_create_bulk()
+        account_move = self.env['account.move']
+
+        for inv in self:
+            inv._check_invoice_move_create()
             if inv.move_id:
                 continue
 
-
             if not inv.date_invoice:
                 inv.write({'date_invoice': fields.Date.context_today(self)})
             if not inv.date_due:
                 inv.write({'date_due': inv.date_invoice})
-            company_currency = inv.company_id.currency_id
-
-            # create move lines (one per invoice line + eventual taxes and analytic lines)
-            iml = inv.invoice_line_move_line_get()
-            #print(iml)
-            iml += inv.tax_line_move_line_get()
-            iml += inv.invoice_line_discounts_move_line_get()
-            #print(iml)
-            #input("ojnsonosnfsnvvsov")
-
-            diff_currency = inv.currency_id != company_currency
-            # create one move line for the total and possibly adjust the other lines amount
-            total, total_currency, iml = inv.compute_invoice_totals(company_currency, iml)
-
-            name = inv.name or ''
-            if inv.payment_term_id:
-                totlines = inv.payment_term_id.with_context(currency_id=company_currency.id).compute(total, inv.date_invoice)[0]
-                res_amount_currency = total_currency
-                for i, t in enumerate(totlines):
-                    if inv.currency_id != company_currency:
-                        amount_currency = company_currency._convert(t[1], inv.currency_id, inv.company_id, inv._get_currency_rate_date() or fields.Date.today())
-                    else:
-                        amount_currency = False
-
-                    # last line: add the diff
-                    res_amount_currency -= amount_currency or 0
-                    if i + 1 == len(totlines):
-                        amount_currency += res_amount_currency
-
-                    iml.append({
-                        'type': 'dest',
-                        'name': name,
-                        'price': t[1],
-                        'account_id': inv.account_id.id,
-                        'date_maturity': t[0],
-                        'amount_currency': diff_currency and amount_currency,
-                        'currency_id': diff_currency and inv.currency_id.id,
-                        'invoice_id': inv.id
-                    })
-            else:
-                iml.append({
-                    'type': 'dest',
-                    'name': name,
-                    'price': total,
-                    'account_id': inv.account_id.id,
-                    'date_maturity': inv.date_due,
-                    'amount_currency': diff_currency and total_currency,
-                    'currency_id': diff_currency and inv.currency_id.id,
-                    'invoice_id': inv.id
-                })
-            part = self.env['res.partner']._find_accounting_partner(inv.partner_id)
-            line = [(0, 0, self.line_get_convert(l, part.id)) for l in iml]
-            line = inv.group_lines(iml, line)
-
-            line = inv.finalize_invoice_move_lines(line)
-
-            date = inv.date or inv.date_invoice
-            move_vals = {
-                'ref': inv.reference,
-                'line_ids': line,
-                'journal_id': inv.journal_id.id,
-                'date': date,
-                'narration': inv.comment,
-            }
+
+            move_vals = inv._prepare_invoice_move_vals()
             move = account_move.create(move_vals)
             # Pass invoice in method post: used if you want to get the same
             # account move reference when creating the same invoice after a cancelled one:
@@ -585,13 +863,57 @@ class AccountInvoiceInherit(models.Model):
             # make the invoice point to that move
             vals = {
                 'move_id': move.id,
-                'date': date,
+                'date': move_vals['date'],
                 'move_name': move.name,
             }
             inv.write(vals)
         return True
 
+    @api.multi
+    def _action_move_create_bulk(self):
+        """ Same as action_move_create_new for many invoices at once: dates are
+        written grouped by value, every move is created in a single create and
+        moves are posted together, in the same order as the invoices.
+        """
+        account_move = self.env['account.move']
+        self._check_invoice_move_create()
+        invoices = self.filtered(lambda inv: not inv.move_id)
+        if not invoices:
+            return True
+
+        no_date = invoices.filtered(lambda inv: not inv.date_invoice)
+        if no_date:
+            no_date.write({'date_invoice': fields.Date.context_today(self)})
+        by_date_due = {}
+        for inv in invoices.filtered(lambda inv: not inv.date_due):
+            by_date_due.setdefault(inv.date_invoice, []).append(inv.id)
+        for date_due, invoice_ids in by_date_due.items():
+            self.browse(invoice_ids).write({'date_due': date_due})
+
+        moves_vals = [inv._prepare_invoice_move_vals() for inv in invoices]
+        moves = account_move.create(moves_vals)
+
+        # Post consecutive moves together; the ones needing their invoice
+        # are posted on their own to keep the numbering order.
+        to_post = account_move
+        for inv, move in zip(invoices, moves):
+            if inv._move_post_needs_invoice():
+                if to_post:
+                    to_post.post()
+                to_post = account_move
+                move.post(invoice=inv)
+            else:
+                to_post |= move
+        if to_post:
+            to_post.post()
 
+        for inv, move, move_vals in zip(invoices, moves, moves_vals):
+            inv.write({
+                'move_id': move.id,
+                'date': move_vals['date'],
+                'move_name': move.name,
+            })
+        return True
 
     AccountInvoice.action_move_create_old = AccountInvoice.action_move_create
     AccountInvoice.action_move_create = action_move_create_new
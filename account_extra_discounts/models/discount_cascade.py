@@ -0,0 +1,50 @@
+# -*- encoding: utf-8 -*-
+"""Cascade de descuentos y cargos.
+
+Pure Python: no ORM access, so the onchange, the invoice totals and the tax
+computation can all share the same arithmetic.
+"""
+
+
+def compute_cascade(base_amount, lines, round_curr=None, get_subtotal=None):
+    """Apply the ordered discount/charge lines over ``base_amount``.
+
+    ``lines`` is an iterable of ``(sequence, compute_type, compute_mode,
+    value)`` tuples, optionally followed by a ``quantity`` (defaults to 1).
+    ``value`` is the percentage for ``percent`` lines and the unit amount for
+    ``amount`` lines. Lines are applied by sequence, keeping the input order
+    for equal sequences; every percentage applies to the running subtotal.
+
+    ``get_subtotal(index, price_unit, quantity)`` returns the untaxed subtotal
+    of the line at ``index`` of the input, so taxes included in the price can
+    be taken out the same way as in the stored line subtotal. Defaults to
+    ``quantity * price_unit``.
+
+    Returns ``(results, total)`` where ``results`` follows the input order and
+    holds a ``(price_unit, subtotal)`` pair per line, ``subtotal`` being
+    unsigned, and ``total`` is the base once every line has been applied.
+    """
+    lines = list(lines)
+    order = sorted(range(len(lines)), key=lambda i: (lines[i][0] or 0, i))
+    results = [None] * len(lines)
+    running = base_amount
+    for index in order:
+        line = lines[index]
+        compute_type, compute_mode, value = line[1], line[2], line[3] or 0.0
+        quantity = line[4] if len(line) > 4 else 1.0
+        if compute_mode == 'percent':
+            price_unit = running * (value / 100.0)
+        else:
+            price_unit = value
+        if get_subtotal:
+            subtotal = get_subtotal(index, price_unit, quantity)
+        else:
+            subtotal = quantity * price_unit
+        if round_curr:
+            subtotal = round_curr(subtotal)
+        if compute_type == 'charge':
+            running += subtotal
+        elif compute_type == 'discount':
+            running -= subtotal
+        results[index] = (price_unit, subtotal)
+    return results, running
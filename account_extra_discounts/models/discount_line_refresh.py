@@ -0,0 +1,26 @@
+# -*- encoding: utf-8 -*-
+from odoo import models, api
+
+from .discount_totals import LINE_TOTAL_FIELDS
+
+
+class AccountInvoiceLineDiscounts(models.Model):
+    """ Loaded after the totals and tax detail hooks, so this write wraps
+    them. """
+    _inherit = 'account.invoice.line.discounts'
+
+    @api.multi
+    def write(self, vals):
+        """ A direct write to the cascade inputs refreshes the draft invoices
+        as the invoice form does: the prices of the percent lines, taxes,
+        tax details and totals, once instead of per line hook. """
+        if self.env.context.get('skip_discount_line_hooks') or not any(name in vals for name in LINE_TOTAL_FIELDS):
+            return super(AccountInvoiceLineDiscounts, self).write(vals)
+        invoices = self.mapped('invoice_id')
+        if vals.get('invoice_id'):
+            invoices |= invoices.browse(vals['invoice_id'])
+        if not invoices or any(inv.state != 'draft' for inv in invoices):
+            return super(AccountInvoiceLineDiscounts, self).write(vals)
+        res = super(AccountInvoiceLineDiscounts, self.with_context(skip_discount_line_hooks=True)).write(vals)
+        invoices._refresh_discounts()
+        return res
@@ -0,0 +1,238 @@
+# -*- encoding: utf-8 -*-
+import logging
+import time
+
+import psycopg2
+
+from odoo import fields, models, api, _
+from odoo.tools import mute_logger
+
+_logger = logging.getLogger(__name__)
+
+CHECKPOINT_PARAM = 'account_extra_discounts.recompute_last_id'
+
+LINE_FIELDS = ['price_subtotal', 'price_total', 'price_subtotal_signed']
+INVOICE_FIELDS = [
+    'amount_untaxed', 'amount_tax', 'amount_total', 'amount_untaxed_signed',
+    'amount_total_signed', 'amount_total_company_signed',
+    'amount_charges', 'amount_discounts', 'discount_line_count',
+]
+
+
+class AccountInvoiceLineDiscounts(models.Model):
+    _inherit = 'account.invoice.line.discounts'
+
+    @api.multi
+    def _recompute_stored_fields(self):
+        """ Recomputes the stored amounts of the lines and the totals of
+        their invoices, in one batch. """
+        for name in LINE_FIELDS:
+            self.env.add_todo(self._fields[name], self)
+        self.mapped('invoice_id')._recompute_discount_totals()
+
+    @api.model
+    def _get_checkpoint_param(self, date_from=None, date_to=None, company_ids=None):
+        """ Name of the system parameter holding the last processed id of the
+        runs with these filters, so runs with other filters do not resume
+        from it. """
+        return '%s.%s_%s_%s' % (
+            CHECKPOINT_PARAM,
+            date_from and fields.Date.to_string(fields.Date.to_date(date_from)) or '',
+            date_to and fields.Date.to_string(fields.Date.to_date(date_to)) or '',
+            '-'.join(str(company_id) for company_id in sorted(company_ids or [])),
+        )
+
+    @api.model
+    def recompute_history(self, date_from=None, date_to=None, company_ids=None, chunk_size=1000, resume=True,
+                          progress=None):
+        """ Recomputes the stored fields of the discount lines by chunks of
+        ids, committing after each one. The last processed id is kept in a
+        system parameter per set of filters, so an interrupted run continues
+        where it stopped. ``progress`` is called with the number of lines
+        done, the total and the last id before every commit. Meant for
+        scheduled actions and jobs, not for requests. """
+        ICP = self.env['ir.config_parameter'].sudo()
+        checkpoint_param = self._get_checkpoint_param(date_from, date_to, company_ids)
+        domain = []
+        if date_from:
+            domain.append(('invoice_id.date_invoice', '>=', date_from))
+        if date_to:
+            domain.append(('invoice_id.date_invoice', '<=', date_to))
+        if company_ids:
+            domain.append(('company_id', 'in', company_ids))
+        last_id = int(ICP.get_param(checkpoint_param, 0)) if resume else 0
+        total = self.search_count(domain + [('id', '>', last_id)])
+        done = 0
+        start = time.time()
+        while True:
+            lines = self.search(domain + [('id', '>', last_id)], order='id', limit=chunk_size)
+            if not lines:
+                break
+            lines._recompute_stored_fields()
+            last_id = lines[-1].id
+            done += len(lines)
+            ICP.set_param(checkpoint_param, last_id)
+            if progress:
+                progress(done, total, last_id)
+            self.env.cr.commit()
+            self.env.clear()
+            _logger.info("Discount lines recomputed: %s/%s (%.1f%%, %.0f lines/s), last id %s",
+                         done, total, total and 100.0 * done / total or 100.0,
+                         done / ((time.time() - start) or 1), last_id)
+        ICP.set_param(checkpoint_param, False)
+        self.env.cr.commit()
+        return done
+
+
+class AccountInvoice(models.Model):
+    _inherit = 'account.invoice'
+
+    @api.multi
+    def _recompute_discount_totals(self):
+        """ Recomputes the stored totals of the invoices, which do not depend
+        on their discount lines. """
+        for name in INVOICE_FIELDS:
+            if name in self._fields:
+                self.env.add_todo(self._fields[name], self)
+        self.recompute()
+
+
+class AccountInvoiceDiscountRecomputeJob(models.Model):
+    _name = 'account.invoice.discount.recompute.job'
+    _description = 'Recálculo de líneas de descuentos/cargos'
+    _order = 'id desc'
+
+    name = fields.Char(string='Nombre', required=True, readonly=True,
+        default=lambda self: fields.Datetime.to_string(fields.Datetime.now()))
+    user_id = fields.Many2one('res.users', string='Usuario', readonly=True,
+        default=lambda self: self.env.user)
+    date_from = fields.Date(string='Desde', readonly=True)
+    date_to = fields.Date(string='Hasta', readonly=True)
+    company_ids = fields.Many2many('res.company', string='Compañías', readonly=True)
+    chunk_size = fields.Integer(string='Líneas por transacción', default=1000, readonly=True)
+    resume = fields.Boolean(string='Continuar la ejecución anterior', default=True, readonly=True)
+    state = fields.Selection(
+        selection=[
+            ('pending', 'Pendiente'),
+            ('running', 'En curso'),
+            ('done', 'Terminado'),
+            ('failed', 'Con errores'),
+        ],
+        string='Estado',
+        default='pending',
+        readonly=True,
+    )
+    line_count = fields.Integer(string='Líneas', readonly=True)
+    done_count = fields.Integer(string='Líneas recalculadas', readonly=True)
+    last_id = fields.Integer(string='Último id procesado', readonly=True)
+    progress = fields.Float(string='Progreso', compute='_compute_progress')
+    error = fields.Text(string='Error', readonly=True)
+
+    @api.multi
+    @api.depends('line_count', 'done_count')
+    def _compute_progress(self):
+        for job in self:
+            job.progress = job.line_count and 100.0 * job.done_count / job.line_count or 0.0
+
+    @api.model
+    def _trigger_cron(self):
+        cron = self.env.ref('account_extra_discounts.ir_cron_discount_recompute_jobs', raise_if_not_found=False)
+        if not cron:
+            return
+        try:
+            with mute_logger('odoo.sql_db'), self.env.cr.savepoint():
+                self.env.cr.execute("SELECT id FROM ir_cron WHERE id = %s FOR UPDATE NOWAIT", (cron.id,))
+                cron.sudo().write({'nextcall': fields.Datetime.now()})
+        except psycopg2.OperationalError:
+            # The cron is running, it takes the job after the current ones
+            pass
+
+    @api.model
+    def _cron_run_jobs(self):
+        """ Runs the queued jobs one after the other, and continues the ones
+        interrupted by a crash or a timeout. The cron never runs twice at
+        the same time, so jobs need no lock of their own. """
+        for job in self.search([('state', 'in', ('pending', 'running'))], order='id'):
+            job._run()
+
+    @api.multi
+    def _run(self):
+        self.ensure_one()
+        cr = self.env.cr
+        # A running job was interrupted, continue from its checkpoint
+        resume = self.resume or self.state == 'running'
+        start_done = resume and self.done_count or 0
+        self.write({'state': 'running', 'error': False})
+        cr.commit()
+
+        def progress(done, total, last_id):
+            self.write({
+                'done_count': start_done + done,
+                'line_count': start_done + total,
+                'last_id': last_id,
+            })
+
+        try:
+            self.env['account.invoice.line.discounts'].recompute_history(
+                date_from=self.date_from,
+                date_to=self.date_to,
+                company_ids=self.company_ids.ids,
+                chunk_size=self.chunk_size or 1000,
+                resume=resume,
+                progress=progress,
+            )
+            self.write({'state': 'done'})
+        except Exception as e:
+            cr.rollback()
+            self.env.clear()
+            _logger.warning("Error recomputing discount lines in job %s", self.id, exc_info=True)
+            self.write({'state': 'failed', 'error': str(e)})
+        cr.commit()
+
+    @api.multi
+    def action_retry(self):
+        self.filtered(lambda job: job.state == 'failed').write({'state': 'running'})
+        self._trigger_cron()
+
+
+class AccountInvoiceDiscountRecomputeWizard(models.TransientModel):
+    _name = 'account.invoice.discount.recompute.wizard'
+    _description = 'Recalcular líneas de descuentos/cargos'
+
+    date_from = fields.Date(string='Desde')
+    date_to = fields.Date(string='Hasta')
+    company_ids = fields.Many2many('res.company', string='Compañías')
+    chunk_size = fields.Integer(string='Líneas por transacción', default=1000)
+    resume = fields.Boolean(string='Continuar la ejecución anterior', default=True)
+    last_id = fields.Integer(string='Último id procesado', compute='_compute_last_id')
+
+    @api.multi
+    @api.depends('date_from', 'date_to', 'company_ids')
+    def _compute_last_id(self):
+        ICP = self.env['ir.config_parameter'].sudo()
+        Lines = self.env['account.invoice.line.discounts']
+        for wizard in self:
+            wizard.last_id = int(ICP.get_param(Lines._get_checkpoint_param(
+                wizard.date_from, wizard.date_to, wizard.company_ids.ids), 0))
+
+    @api.multi
+    def action_recompute(self):
+        """ Queues the recompute for the scheduled action, which commits
+        after every chunk, and shows its progress. """
+        self.ensure_one()
+        Job = self.env['account.invoice.discount.recompute.job']
+        job = Job.create({
+            'date_from': self.date_from,
+            'date_to': self.date_to,
+            'company_ids': [(6, 0, self.company_ids.ids)],
+            'chunk_size': self.chunk_size or 1000,
+            'resume': self.resume,
+        })
+        Job._trigger_cron()
+        return {
+            'name': _('Recalcular descuentos/cargos'),
+            'type': 'ir.actions.act_window',
+            'res_model': Job._name,
+            'view_mode': 'form',
+            'res_id': job.id,
+        }
@@ -0,0 +1,194 @@
+# -*- encoding: utf-8 -*-
+from odoo import fields, models, api, _
+from odoo.addons import decimal_precision as dp
+
+from .discount_cascade import compute_cascade
+from .tax_cache import TaxComputeCache
+
+
+class AccountInvoiceDiscountRule(models.Model):
+    _name = 'account.invoice.discount.rule'
+    _description = 'Regla de descuentos/cargos'
+    _order = 'sequence, id'
+
+    name = fields.Char(string='Nombre', required=True)
+    sequence = fields.Integer(default=10, index=True)
+    active = fields.Boolean(default=True)
+    company_id = fields.Many2one('res.company', string='Company', index=True,
+        default=lambda self: self.env.user.company_id)
+    invoice_type = fields.Selection(
+        selection=[
+            ('out_invoice', 'Factura de cliente'),
+            ('in_invoice', 'Factura de proveedor'),
+        ],
+        string='Tipo de factura',
+        default='out_invoice',
+        required=True,
+        index=True,
+    )
+    partner_id = fields.Many2one('res.partner', string='Empresa', index=True,
+        help="Si se indica, la regla solo se aplica a esta empresa.")
+    partner_category_id = fields.Many2one('res.partner.category', string='Categoría de empresa', index=True)
+    product_categ_id = fields.Many2one('product.category', string='Categoría de producto', index=True,
+        help="La regla se aplica si alguna línea de la factura tiene un producto de esta categoría.")
+    amount_min = fields.Float(string='Importe mínimo', digits=dp.get_precision('Account'))
+    amount_max = fields.Float(string='Importe máximo', digits=dp.get_precision('Account'),
+        help="Cero para no limitar.")
+    line_ids = fields.One2many('account.invoice.discount.rule.line', 'rule_id', string='Descuentos/Cargos', copy=True)
+
+    def _match(self, invoice, amount, categ_ids):
+        self.ensure_one()
+        partner = invoice.partner_id.commercial_partner_id
+        if self.partner_category_id and self.partner_category_id not in (invoice.partner_id.category_id | partner.category_id):
+            return False
+        if self.product_categ_id and self.product_categ_id.id not in categ_ids:
+            return False
+        if amount < self.amount_min or (self.amount_max and amount > self.amount_max):
+            return False
+        return True
+
+    @api.model
+    def _get_rule_index(self, invoices):
+        """ Loads the active rules for the invoices in one query and indexes
+        them by (company, invoice type, partner); partner False holds the
+        rules for every partner. """
+        rules = self.search([
+            ('company_id', 'in', invoices.mapped('company_id').ids + [False]),
+            ('invoice_type', 'in', list(set(invoices.mapped('type')))),
+            ('partner_id', 'in', invoices.mapped('partner_id.commercial_partner_id').ids + [False]),
+        ])
+        index = {}
+        for rule in rules:
+            index.setdefault((rule.company_id.id, rule.invoice_type, rule.partner_id.id), []).append(rule)
+        return index
+
+    @api.model
+    def _find_rules(self, index, invoice, amount, categ_ids):
+        partner_id = invoice.partner_id.commercial_partner_id.id
+        candidates = []
+        for company_id in (invoice.company_id.id, False):
+            for rule_partner_id in (partner_id, False):
+                candidates += index.get((company_id, invoice.type, rule_partner_id), [])
+        candidates.sort(key=lambda rule: (rule.sequence, rule.id))
+        return [rule for rule in candidates if rule._match(invoice, amount, categ_ids)]
+
+
+class AccountInvoiceDiscountRuleLine(models.Model):
+    _name = 'account.invoice.discount.rule.line'
+    _description = 'Línea de regla de descuentos/cargos'
+    _order = 'sequence, id'
+
+    rule_id = fields.Many2one('account.invoice.discount.rule', required=True, ondelete='cascade', index=True)
+    sequence = fields.Integer(default=10)
+    product_id = fields.Many2one('product.product', string='Producto', ondelete='restrict')
+    name = fields.Char(string='Descripción')
+    compute_type = fields.Selection(
+        selection=[
+            ('discount','Descuento'),
+            ('charge','Cargo'),
+        ],
+        string="Tipo",
+        default='discount',
+        required=True,
+    )
+    compute_mode = fields.Selection(
+        selection=[
+            ('percent','Porcentaje'),
+            ('amount','Importe'),
+        ],
+        string="Modo de calculo",
+        default='percent',
+        required=True,
+    )
+    value = fields.Float(string='Valor', digits=dp.get_precision('Product Price'),
+        help="Porcentaje o importe según el modo de cálculo.")
+    account_id = fields.Many2one('account.account', string='Cuenta', domain=[('deprecated', '=', False)],
+        help="Por defecto, la cuenta del producto.")
+    tax_ids = fields.Many2many('account.tax', 'account_invoice_discount_rule_line_tax', 'rule_line_id', 'tax_id',
+        string='Taxes', help="Por defecto, los impuestos del producto.")
+
+
+class AccountInvoice(models.Model):
+    _inherit = 'account.invoice'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        invoices = super(AccountInvoice, self).create(vals_list)
+        if not self.env.context.get('skip_discount_rules'):
+            invoices.filtered(lambda inv: inv.invoice_line_ids and not inv.account_invoice_line_discount_ids
+                              and inv.type in ('out_invoice', 'in_invoice'))._apply_discount_rules()
+        return invoices
+
+    @api.multi
+    @api.returns('self', lambda value: value.id)
+    def copy(self, default=None):
+        # A copy does not get the rules applied again
+        return super(AccountInvoice, self.with_context(skip_discount_rules=True)).copy(default)
+
+    @api.multi
+    def _apply_discount_rules(self):
+        """ Adds the discount/charge lines of the matching rules to the
+        invoices, with their final amounts computed by the cascade, then
+        computes taxes and totals of the whole batch. """
+        if not self:
+            return
+        Rule = self.env['account.invoice.discount.rule']
+        DiscLine = self.env['account.invoice.line.discounts']
+        index = Rule._get_rule_index(self)
+        if not index:
+            return
+        self.mapped('invoice_line_ids.product_id.categ_id')
+        vals_list = []
+        for invoice in self:
+            amount = sum(invoice.invoice_line_ids.mapped('price_subtotal'))
+            categ_ids = set(invoice.invoice_line_ids.mapped('product_id.categ_id').ids)
+            rule_lines = [line for rule in Rule._find_rules(index, invoice, amount, categ_ids) for line in rule.line_ids]
+            if not rule_lines:
+                continue
+            company = invoice.company_id or self.env.user.company_id
+            accounts_taxes = []
+            for line in rule_lines:
+                account_id, tax_ids = line.account_id.id, line.tax_ids.ids
+                if line.product_id and not (account_id and tax_ids):
+                    values = DiscLine._get_product_values(
+                        line.product_id.id, invoice.fiscal_position_id.id, company.id,
+                        invoice.type, invoice.partner_id.lang or self.env.lang)
+                    account_id = account_id or values[0]
+                    tax_ids = tax_ids or list(values[2])
+                accounts_taxes.append((account_id, tax_ids))
+            cache = TaxComputeCache(self.env)
+
+            def get_subtotal(index, price_unit, quantity):
+                taxes = self.env['account.tax'].browse(accounts_taxes[index][1])
+                if not taxes:
+                    return quantity * price_unit
+                return cache.compute_all(taxes, price_unit, invoice.currency_id, quantity,
+                                         rule_lines[index].product_id, invoice.partner_id)['total_excluded']
+
+            results, amount_untaxed = compute_cascade(amount, [
+                (sequence, line.compute_type, line.compute_mode, line.value)
+                for sequence, line in enumerate(rule_lines)
+            ], round_curr=invoice.currency_id.round, get_subtotal=get_subtotal)
+            for sequence, (line, (price_unit, subtotal), (account_id, tax_ids)) in enumerate(
+                    zip(rule_lines, results, accounts_taxes)):
+                vals_list.append({
+                    'invoice_id': invoice.id,
+                    'sequence': sequence,
+                    'product_id': line.product_id.id,
+                    'name': line.name or line.product_id.name or line.rule_id.name,
+                    'compute_type': line.compute_type,
+                    'compute_mode': line.compute_mode,
+                    'discount': line.compute_mode == 'percent' and line.value or 0.0,
+                    'price_unit': price_unit,
+                    'quantity': 1.0,
+                    'account_id': account_id,
+                    'uom_id': line.product_id.uom_id.id,
+                    'invoice_line_tax_ids': [(6, 0, tax_ids)],
+                })
+        if not vals_list:
+            return
+        # Taxes, tax details and totals are computed once below
+        DiscLine.with_context(skip_discount_line_hooks=True).create(vals_list)
+        invoices = self.browse(list(set(vals['invoice_id'] for vals in vals_list)))
+        invoices.compute_taxes()
+        invoices._recompute_discount_totals()
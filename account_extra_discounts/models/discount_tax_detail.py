@@ -0,0 +1,105 @@
+# -*- encoding: utf-8 -*-
+from odoo import fields, models, api
+from odoo.tools import split_every
+
+from .tax_cache import TaxComputeCache
+
+# Line fields the tax breakdown depends on
+TAX_DETAIL_FIELDS = ['invoice_id', 'compute_type', 'price_unit', 'quantity',
+                     'product_id', 'invoice_line_tax_ids']
+
+
+class AccountInvoiceLineDiscountTaxDetail(models.Model):
+    """ Tax base and amount of every discount/charge line per tax, as in the
+    tax lines of its invoice: negative for discounts. Kept up to date when the
+    lines or the invoice taxes are computed, so tax reports are plain SQL
+    aggregates. """
+    _name = 'account.invoice.line.discount.tax.detail'
+    _description = 'Desglose de impuestos de descuentos/cargos'
+    _log_access = False
+
+    discount_line_id = fields.Many2one('account.invoice.line.discounts', required=True,
+        ondelete='cascade', index=True)
+    invoice_id = fields.Many2one('account.invoice', required=True, ondelete='cascade', index=True)
+    tax_id = fields.Many2one('account.tax', string='Impuesto', required=True, ondelete='cascade')
+    company_id = fields.Many2one('res.company', related='invoice_id.company_id', store=True, readonly=True)
+    date = fields.Date(related='invoice_id.date_invoice', store=True, readonly=True)
+    currency_id = fields.Many2one('res.currency', related='invoice_id.currency_id', store=True, readonly=True)
+    base = fields.Monetary(string='Base', readonly=True)
+    amount = fields.Monetary(string='Importe', readonly=True)
+
+    @api.model_cr
+    def init(self):
+        self._cr.execute("""
+            CREATE INDEX IF NOT EXISTS account_invoice_line_discount_tax_detail_tax_date_idx
+            ON account_invoice_line_discount_tax_detail (tax_id, date)
+        """)
+        self._cr.execute("""
+            CREATE INDEX IF NOT EXISTS account_invoice_line_discount_tax_detail_company_date_idx
+            ON account_invoice_line_discount_tax_detail (company_id, date)
+        """)
+
+
+class AccountInvoiceLineDiscounts(models.Model):
+    _inherit = 'account.invoice.line.discounts'
+
+    tax_detail_ids = fields.One2many('account.invoice.line.discount.tax.detail', 'discount_line_id',
+        string='Desglose de impuestos', readonly=True)
+
+    @api.multi
+    def _refresh_tax_details(self):
+        """ Replaces the tax breakdown of the lines with a bulk insert """
+        if not self:
+            return
+        cache = TaxComputeCache(self.env)
+        rows = []
+        for line in self.filtered('invoice_id'):
+            invoice = line.invoice_id
+            price_unit = line.compute_type == 'discount' and -line.price_unit or line.price_unit
+            taxes = cache.compute_all(line.invoice_line_tax_ids, price_unit, invoice.currency_id,
+                                      line.quantity, line.product_id, invoice.partner_id)['taxes']
+            for tax in taxes:
+                rows.append((line.id, invoice.id, tax['id'], invoice.company_id.id or None,
+                             invoice.date_invoice or None, invoice.currency_id.id or None,
+                             tax['base'], tax['amount']))
+        cache.flush_stats()
+        cr = self.env.cr
+        cr.execute("DELETE FROM account_invoice_line_discount_tax_detail WHERE discount_line_id IN %s",
+                   (tuple(self.ids),))
+        for chunk in split_every(1000, rows):
+            cr.execute("""
+                INSERT INTO account_invoice_line_discount_tax_detail
+                    (discount_line_id, invoice_id, tax_id, company_id, date, currency_id, base, amount)
+                VALUES """ + ', '.join(['(%s, %s, %s, %s, %s, %s, %s, %s)'] * len(chunk)),
+                [value for row in chunk for value in row])
+        self.env['account.invoice.line.discount.tax.detail'].invalidate_cache()
+        self.invalidate_cache(['tax_detail_ids'], self.ids)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super(AccountInvoiceLineDiscounts, self).create(vals_list)
+        if not self.env.context.get('skip_discount_line_hooks'):
+            lines._refresh_tax_details()
+        return lines
+
+    @api.multi
+    def write(self, vals):
+        res = super(AccountInvoiceLineDiscounts, self).write(vals)
+        if not self.env.context.get('skip_discount_line_hooks') and any(name in vals for name in TAX_DETAIL_FIELDS):
+            self._refresh_tax_details()
+        return res
+
+    @api.multi
+    def _recompute_stored_fields(self):
+        super(AccountInvoiceLineDiscounts, self)._recompute_stored_fields()
+        self._refresh_tax_details()
+
+
+class AccountInvoice(models.Model):
+    _inherit = 'account.invoice'
+
+    @api.multi
+    def compute_taxes(self):
+        res = super(AccountInvoice, self).compute_taxes()
+        self.mapped('account_invoice_line_discount_ids')._refresh_tax_details()
+        return res
@@ -0,0 +1,185 @@
+# -*- encoding: utf-8 -*-
+import logging
+
+from odoo import fields, models, api
+
+from .account_line_discunts import _convert_with_rates
+
+_logger = logging.getLogger(__name__)
+
+INCREMENTAL_PARAM = 'account_extra_discounts.incremental_totals'
+
+# Line fields the discount cascade of the invoice depends on
+LINE_TOTAL_FIELDS = [
+    'invoice_id', 'sequence', 'compute_type', 'compute_mode', 'discount', 'price_unit',
+    'quantity', 'invoice_line_tax_ids', 'product_id',
+]
+INVOICE_TOTAL_FIELDS = [
+    'amount_untaxed', 'amount_total', 'amount_untaxed_signed',
+    'amount_total_signed', 'amount_total_company_signed',
+]
+
+
+class AccountInvoiceLineDiscounts(models.Model):
+    _inherit = 'account.invoice.line.discounts'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        if self.env.context.get('skip_discount_line_hooks'):
+            return super(AccountInvoiceLineDiscounts, self).create(vals_list)
+        invoice_ids = set(vals['invoice_id'] for vals in vals_list if vals.get('invoice_id'))
+        Invoice = self.env['account.invoice']
+        snapshot, before = Invoice._prepare_discount_totals(invoice_ids)
+        lines = super(AccountInvoiceLineDiscounts, self).create(vals_list)
+        Invoice._update_discount_totals(snapshot, before)
+        return lines
+
+    @api.multi
+    def write(self, vals):
+        if self.env.context.get('skip_discount_line_hooks') or not any(name in vals for name in LINE_TOTAL_FIELDS):
+            return super(AccountInvoiceLineDiscounts, self).write(vals)
+        invoice_ids = set(self.mapped('invoice_id').ids)
+        if vals.get('invoice_id'):
+            invoice_ids.add(vals['invoice_id'])
+        Invoice = self.env['account.invoice']
+        snapshot, before = Invoice._prepare_discount_totals(invoice_ids)
+        res = super(AccountInvoiceLineDiscounts, self).write(vals)
+        Invoice._update_discount_totals(snapshot, before)
+        return res
+
+    @api.multi
+    def unlink(self):
+        if self.env.context.get('skip_discount_line_hooks'):
+            return super(AccountInvoiceLineDiscounts, self).unlink()
+        Invoice = self.env['account.invoice']
+        snapshot, before = Invoice._prepare_discount_totals(set(self.mapped('invoice_id').ids))
+        res = super(AccountInvoiceLineDiscounts, self).unlink()
+        Invoice._update_discount_totals(snapshot, before)
+        return res
+
+
+class AccountInvoice(models.Model):
+    _inherit = 'account.invoice'
+
+    @api.model
+    def _get_amount_untaxed_snapshot(self, invoice_ids):
+        """ Returns the stored untaxed amount and the subtotal of the invoice
+        lines, which discount line changes do not alter, by invoice id. """
+        if not invoice_ids:
+            return {}
+        self.env.cr.execute("""
+            SELECT i.id, i.amount_untaxed,
+                   COALESCE((SELECT SUM(l.price_subtotal) FROM account_invoice_line l
+                             WHERE l.invoice_id = i.id), 0)
+            FROM account_invoice i
+            WHERE i.id IN %s
+        """, (tuple(invoice_ids),))
+        return {invoice_id: (amount_untaxed, base) for invoice_id, amount_untaxed, base in self.env.cr.fetchall()}
+
+    @api.model
+    def _get_discount_contributions(self, snapshot):
+        """ Returns what the cascade of the discount/charge lines adds to the
+        untaxed amount of every invoice, computed as in _compute_amount from
+        the stored subtotal of the invoice lines, so they are not read. """
+        invoices = self.browse(list(snapshot))
+        invoices.invalidate_cache(['account_invoice_line_discount_ids'], invoices.ids)
+        invoices.mapped('account_invoice_line_discount_ids.invoice_line_tax_ids')
+        return {invoice.id: invoice._get_discount_cascade(snapshot[invoice.id][1])[2] - snapshot[invoice.id][1]
+                for invoice in invoices.exists()}
+
+    @api.model
+    def _prepare_discount_totals(self, invoice_ids):
+        """ Returns the snapshot and the contributions of the invoices before
+        their discount/charge lines change. Both are only needed in
+        incremental mode; otherwise the snapshot only holds the invoice ids
+        and the contributions are None. """
+        if not self.env['ir.config_parameter'].sudo().get_param(INCREMENTAL_PARAM):
+            return dict.fromkeys(invoice_ids), None
+        snapshot = self._get_amount_untaxed_snapshot(invoice_ids)
+        return snapshot, self._get_discount_contributions(snapshot)
+
+    @api.model
+    def _update_discount_totals(self, snapshot, before):
+        """ Updates the totals of the invoices after their discount/charge
+        lines changed. In incremental mode only the difference between the
+        ``before`` contributions and the current ones is added, by SQL, to
+        the invoices whose untaxed amount still holds the ``snapshot`` value;
+        an invoice recomputed in between already has the right totals.
+        Either way the cascade of every discount/charge line of the invoice
+        is run again, since a line changes the base of the following ones;
+        incremental mode only saves reading the invoice lines and the tax
+        lines. Otherwise the totals are recomputed with the full formula. """
+        if not snapshot:
+            return
+        invoices = self.browse(list(snapshot)).exists()
+        if before is None:
+            invoices._recompute_discount_totals()
+            return
+        after = self._get_discount_contributions(snapshot)
+        rates = {}
+        updated = []
+        for invoice in invoices:
+            currency = invoice.currency_id
+            delta = after.get(invoice.id, 0.0) - before.get(invoice.id, 0.0)
+            if currency.is_zero(delta):
+                continue
+            delta_company = delta
+            company = invoice.company_id
+            if currency and company and currency != company.currency_id:
+                delta_company = _convert_with_rates(rates, currency, delta, company.currency_id, company,
+                                                    invoice.date_invoice or fields.Date.today())
+            sign = invoice.type in ['in_refund', 'out_refund'] and -1 or 1
+            self.env.cr.execute("""
+                UPDATE account_invoice
+                SET amount_untaxed = COALESCE(amount_untaxed, 0) + %(delta)s,
+                    amount_total = COALESCE(amount_total, 0) + %(delta)s,
+                    amount_total_signed = COALESCE(amount_total_signed, 0) + %(delta_signed)s,
+                    amount_untaxed_signed = COALESCE(amount_untaxed_signed, 0) + %(delta_company)s,
+                    amount_total_company_signed = COALESCE(amount_total_company_signed, 0) + %(delta_company)s
+                WHERE id = %(id)s AND amount_untaxed IS NOT DISTINCT FROM %(snapshot)s
+            """, {
+                'id': invoice.id,
+                'delta': delta,
+                'delta_signed': delta * sign,
+                'delta_company': delta_company * sign,
+                'snapshot': snapshot[invoice.id][0],
+            })
+            if self.env.cr.rowcount:
+                updated.append(invoice.id)
+        if updated:
+            self.invalidate_cache(INVOICE_TOTAL_FIELDS, updated)
+
+    @api.multi
+    def _check_discount_totals(self, fix=True):
+        """ Compares the stored untaxed and total amounts of the invoices
+        with the full formula, the same cascade as _compute_amount, and
+        recomputes the invoices that differ. Returns them. """
+        if not self:
+            return self
+        snapshot = self._get_amount_untaxed_snapshot(self.ids)
+        contributions = self._get_discount_contributions(snapshot)
+        wrong_ids = []
+        for invoice in self.browse(list(contributions)):
+            currency = invoice.currency_id
+            expected = snapshot[invoice.id][1] + contributions[invoice.id]
+            if (currency.compare_amounts(invoice.amount_untaxed, expected) != 0
+                    or currency.compare_amounts(invoice.amount_total, expected + invoice.amount_tax) != 0):
+                wrong_ids.append(invoice.id)
+        wrong = self.browse(wrong_ids)
+        if wrong:
+            _logger.warning("Invoice totals out of date: %s", wrong_ids)
+            if fix:
+                wrong._recompute_discount_totals()
+        return wrong
+
+    @api.model
+    def _cron_check_discount_totals(self, chunk_size=1000):
+        """ Checks the totals of the draft invoices with discount/charge
+        lines, by chunks. """
+        invoices = self.search([('state', '=', 'draft'), ('discount_line_count', '>', 0)])
+        for index in range(0, len(invoices), chunk_size):
+            invoices[index:index + chunk_size]._check_discount_totals()
+
+    @api.multi
+    def action_check_discount_totals(self):
+        self._check_discount_totals()
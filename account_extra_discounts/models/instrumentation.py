@@ -0,0 +1,97 @@
+# -*- encoding: utf-8 -*-
+""" Opt-in timing of the invoice methods replaced by this module.
+
+Enabled with ``account_extra_discounts_instrumentation = True`` in the server
+configuration file, or at runtime for every worker from the *Métricas de
+descuentos* server actions, which set a system parameter. When disabled,
+instrumented methods only pay for a cached parameter read. The metrics are
+collected per worker process.
+"""
+import functools
+import logging
+import threading
+import time
+
+from odoo.tools import config
+
+_logger = logging.getLogger(__name__)
+
+PARAM = 'account_extra_discounts.instrumentation'
+
+# Upper bounds, in milliseconds, of the duration histogram buckets
+BUCKETS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+_config_enabled = bool(config.get('account_extra_discounts_instrumentation'))
+_stats = {}
+_lock = threading.Lock()
+
+
+def is_enabled(env):
+    # get_param is cached in the registry, and set_param invalidates it in
+    # every worker
+    return _config_enabled or bool(env['ir.config_parameter'].sudo().get_param(PARAM))
+
+
+def set_enabled(env, enabled):
+    env['ir.config_parameter'].sudo().set_param(PARAM, enabled and '1' or False)
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+def _record(name, duration, queries, records):
+    millis = duration * 1000.0
+    bucket = next((b for b in BUCKETS if millis <= b), None)
+    with _lock:
+        stats = _stats.setdefault(name, {
+            'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'queries': 0,
+            'records': 0, 'histogram': dict.fromkeys(BUCKETS + (None,), 0),
+        })
+        stats['calls'] += 1
+        stats['seconds'] += duration
+        stats['max_seconds'] = max(stats['max_seconds'], duration)
+        stats['queries'] += queries
+        stats['records'] += records
+        stats['histogram'][bucket] += 1
+
+
+def instrumented(name):
+    """ Decorator recording wall time, SQL queries and number of records of
+    every call of the decorated model method while instrumentation is on. """
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not is_enabled(self.env):
+                return method(self, *args, **kwargs)
+            cr = self.env.cr
+            queries = getattr(cr, 'sql_log_count', 0)
+            start = time.time()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                _record(name, time.time() - start,
+                        getattr(cr, 'sql_log_count', 0) - queries, len(self))
+        return wrapper
+    return decorate
+
+
+def get_stats():
+    with _lock:
+        return {name: dict(stats, histogram=dict(stats['histogram']))
+                for name, stats in _stats.items()}
+
+
+def format_summary():
+    lines = ['%-40s %8s %10s %10s %10s %10s' % (
+        'method', 'calls', 'total s', 'max s', 'queries', 'records')]
+    for name, stats in sorted(get_stats().items(), key=lambda item: -item[1]['seconds']):
+        lines.append('%-40s %8d %10.3f %10.3f %10d %10d' % (
+            name, stats['calls'], stats['seconds'], stats['max_seconds'],
+            stats['queries'], stats['records']))
+        lines.append('    ms: ' + ', '.join(
+            '%s%s: %s' % ('<=' if bucket else '>', bucket or BUCKETS[-1], count)
+            for bucket, count in sorted(stats['histogram'].items(), key=lambda item: item[0] or float('inf'))
+            if count))
+    return '\n'.join(lines)
@@ -0,0 +1,11 @@
+# -*- encoding: utf-8 -*-
+from odoo import fields, models
+
+
+class InstrumentationSummary(models.TransientModel):
+    _name = 'account.invoice.discounts.instrumentation.summary'
+    _description = 'Métricas de descuentos'
+
+    enabled = fields.Boolean(string='Activadas', readonly=True)
+    summary = fields.Text(string='Resumen', readonly=True,
+        help="Métricas recogidas por el proceso que ha atendido la petición.")
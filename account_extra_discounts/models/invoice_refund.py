@@ -0,0 +1,64 @@
+# -*- encoding: utf-8 -*-
+import logging
+
+from odoo import models, api, _
+
+_logger = logging.getLogger(__name__)
+
+
+class AccountInvoice(models.Model):
+    _inherit = 'account.invoice'
+
+    @api.model
+    def _prepare_refund(self, invoice, date_invoice=None, date=None, description=None, journal_id=None):
+        values = super(AccountInvoice, self)._prepare_refund(
+            invoice, date_invoice=date_invoice, date=date, description=description, journal_id=journal_id)
+        # The refund type reverses the sign of the discount/charge lines
+        values['account_invoice_line_discount_ids'] = self._refund_cleanup_lines(
+            invoice.account_invoice_line_discount_ids)
+        return values
+
+    @api.multi
+    def refund_bulk(self, date_invoice=None, date=None, description=None, journal_id=None,
+                    post=False, batch_size=500):
+        """ Creates the credit notes of the invoices, with their lines,
+        discount/charge lines and tax lines, through one ``create`` per batch,
+        then recomputes the totals and tax details of each batch at once.
+        Unlike ``refund`` no message is posted: the origin of the credit note
+        already points to its invoice. ``post`` validates them with the bulk move creation,
+        ``'background'`` hands them to a validation job instead. """
+        refunds = self.browse()
+        Refund = self.with_context(skip_discount_rules=True, skip_discount_refresh=True,
+                                   skip_discount_line_hooks=True)
+        for index in range(0, len(self), batch_size):
+            batch = self[index:index + batch_size]
+            batch.mapped('invoice_line_ids.invoice_line_tax_ids')
+            batch.mapped('account_invoice_line_discount_ids.invoice_line_tax_ids')
+            batch.mapped('tax_line_ids')
+            vals_list = [self._prepare_refund(invoice, date_invoice=date_invoice, date=date,
+                                              description=description, journal_id=journal_id)
+                         for invoice in batch]
+            # Back to the caller's context, so the hooks run on later changes
+            new_refunds = Refund.create(vals_list).with_env(self.env)
+            # The line hooks are skipped, refresh the whole batch at once
+            new_refunds.mapped('account_invoice_line_discount_ids')._refresh_tax_details()
+            new_refunds._recompute_discount_totals()
+            if post is True:
+                new_refunds.action_invoice_open()
+            refunds |= new_refunds
+            _logger.info("Credit notes created: %s/%s", len(refunds), len(self))
+        if post == 'background':
+            refunds.action_invoice_open_background()
+        return refunds
+
+    @api.multi
+    def action_refund_bulk(self):
+        refunds = self.filtered(lambda inv: inv.state in ('open', 'in_payment', 'paid')
+                                and inv.type in ('out_invoice', 'in_invoice')).refund_bulk()
+        return {
+            'name': _('Credit Notes'),
+            'type': 'ir.actions.act_window',
+            'res_model': 'account.invoice',
+            'view_mode': 'tree,form',
+            'domain': [('id', 'in', refunds.ids)],
+        }
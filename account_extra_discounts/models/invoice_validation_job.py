@@ -0,0 +1,202 @@
+# -*- encoding: utf-8 -*-
+import logging
+import random
+import threading
+import time
+
+from psycopg2 import OperationalError
+
+import odoo
+from odoo import fields, models, api, _
+from odoo.service.model import PG_CONCURRENCY_ERRORS_TO_RETRY
+
+_logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+
+
+class AccountInvoiceValidationJob(models.Model):
+    _name = 'account.invoice.validation.job'
+    _description = 'Validación de facturas en segundo plano'
+    _order = 'id desc'
+
+    name = fields.Char(string='Nombre', required=True, readonly=True,
+        default=lambda self: fields.Datetime.to_string(fields.Datetime.now()))
+    user_id = fields.Many2one('res.users', string='Usuario', readonly=True,
+        default=lambda self: self.env.user)
+    chunk_size = fields.Integer(string='Facturas por bloque', default=200)
+    chunk_ids = fields.One2many(
+        comodel_name='account.invoice.validation.job.chunk',
+        inverse_name='job_id',
+        string='Bloques',
+        readonly=True,
+    )
+    # Progress is computed from the chunks so that workers never write the
+    # job row and never wait on each other.
+    state = fields.Selection(
+        selection=[
+            ('pending', 'Pendiente'),
+            ('running', 'En curso'),
+            ('done', 'Terminado'),
+            ('failed', 'Con errores'),
+        ],
+        string='Estado',
+        compute='_compute_progress',
+    )
+    invoice_count = fields.Integer(string='Facturas', compute='_compute_progress')
+    done_count = fields.Integer(string='Facturas validadas', compute='_compute_progress')
+    progress = fields.Float(string='Progreso', compute='_compute_progress')
+
+    @api.multi
+    @api.depends('chunk_ids.state', 'chunk_ids.invoice_count')
+    def _compute_progress(self):
+        for job in self:
+            states = set(job.chunk_ids.mapped('state'))
+            job.invoice_count = sum(job.chunk_ids.mapped('invoice_count'))
+            job.done_count = sum(job.chunk_ids.filtered(lambda c: c.state == 'done').mapped('invoice_count'))
+            job.progress = job.invoice_count and 100.0 * job.done_count / job.invoice_count or 0.0
+            if 'pending' in states:
+                job.state = 'running' if states - {'pending'} else 'pending'
+            elif 'failed' in states:
+                job.state = 'failed'
+            else:
+                job.state = 'done'
+
+    @api.model
+    def create_for_invoices(self, invoices, chunk_size=None):
+        job = self.create({'chunk_size': chunk_size or 200})
+        ids = invoices.ids
+        self.env['account.invoice.validation.job.chunk'].create([{
+            'job_id': job.id,
+            'sequence': index,
+            'invoice_ids': [(6, 0, ids[start:start + job.chunk_size])],
+        } for index, start in enumerate(range(0, len(ids), job.chunk_size))])
+        return job
+
+    @api.multi
+    def action_retry_failed(self):
+        self.mapped('chunk_ids').filtered(lambda c: c.state == 'failed').write({
+            'state': 'pending',
+            'attempts': 0,
+            'error': False,
+        })
+
+    @api.model
+    def _cron_process_jobs(self):
+        """ Runs a pool of workers consuming the pending chunks. Every chunk
+        is validated in its own cursor and transaction. """
+        workers = int(self.env['ir.config_parameter'].sudo().get_param(
+            'account_extra_discounts.validation_workers', 2))
+        args = (self.env.cr.dbname, self.env.uid, dict(self.env.context))
+        threads = [threading.Thread(target=self._worker_loop, args=args,
+                                    name='invoice_validation_%s' % i)
+                   for i in range(max(workers, 1))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _worker_loop(self, dbname, uid, context):
+        threading.current_thread().dbname = dbname
+        registry = odoo.registry(dbname)
+        with api.Environment.manage():
+            while True:
+                with registry.cursor() as cr:
+                    env = api.Environment(cr, uid, context)
+                    if not env['account.invoice.validation.job.chunk']._process_next():
+                        return
+
+
+class AccountInvoiceValidationJobChunk(models.Model):
+    _name = 'account.invoice.validation.job.chunk'
+    _description = 'Bloque de validación de facturas'
+    _order = 'job_id, sequence, id'
+
+    job_id = fields.Many2one('account.invoice.validation.job', string='Trabajo',
+        required=True, ondelete='cascade', index=True)
+    sequence = fields.Integer(default=10)
+    invoice_ids = fields.Many2many('account.invoice',
+        'account_invoice_validation_chunk_rel', 'chunk_id', 'invoice_id',
+        string='Facturas')
+    invoice_count = fields.Integer(string='Facturas', compute='_compute_invoice_count', store=True)
+    state = fields.Selection(
+        selection=[
+            ('pending', 'Pendiente'),
+            ('done', 'Terminado'),
+            ('failed', 'Error'),
+        ],
+        string='Estado',
+        default='pending',
+        required=True,
+        index=True,
+    )
+    attempts = fields.Integer(string='Intentos', default=0)
+    error = fields.Text(string='Error')
+    date_done = fields.Datetime(string='Fecha fin')
+
+    @api.multi
+    @api.depends('invoice_ids')
+    def _compute_invoice_count(self):
+        for chunk in self:
+            chunk.invoice_count = len(chunk.invoice_ids)
+
+    @api.model
+    def _claim_next(self):
+        """ Locks the next pending chunk; chunks locked by other workers are
+        skipped. The lock is kept until the end of the transaction. """
+        self.env.cr.execute("""
+            SELECT id FROM account_invoice_validation_job_chunk
+            WHERE state = 'pending'
+            ORDER BY job_id, sequence, id
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        """)
+        row = self.env.cr.fetchone()
+        return self.browse(row and row[0] or [])
+
+    @api.model
+    def _process_next(self):
+        """ Validates the next pending chunk in the current transaction and
+        commits. Returns False when there is nothing left to do. """
+        cr = self.env.cr
+        chunk = self._claim_next()
+        if not chunk:
+            return False
+        try:
+            # Validate as the user who queued the job, with their access rights and rules
+            user = chunk.job_id.user_id or self.env.user
+            invoices = chunk.with_env(self.env(user=user.id)).invoice_ids
+            invoices.filtered(lambda inv: inv.state == 'draft').action_invoice_open()
+            chunk.write({'state': 'done', 'error': False, 'date_done': fields.Datetime.now()})
+            cr.commit()
+        except Exception as e:
+            cr.rollback()
+            self.env.clear()
+            retry = isinstance(e, OperationalError) and e.pgcode in PG_CONCURRENCY_ERRORS_TO_RETRY
+            attempts = chunk.attempts + 1
+            if retry and attempts < MAX_ATTEMPTS:
+                _logger.info("Concurrency error validating invoices of chunk %s, retry %s", chunk.id, attempts)
+                chunk.write({'attempts': attempts})
+                cr.commit()
+                time.sleep(random.uniform(0.0, 2 ** attempts))
+            else:
+                _logger.warning("Error validating invoices of chunk %s", chunk.id, exc_info=True)
+                chunk.write({'state': 'failed', 'attempts': attempts, 'error': str(e)})
+                cr.commit()
+        return True
+
+
+class AccountInvoiceInherit(models.Model):
+    _inherit = 'account.invoice'
+
+    @api.multi
+    def action_invoice_open_background(self):
+        invoices = self.filtered(lambda inv: inv.state == 'draft')
+        job = self.env['account.invoice.validation.job'].create_for_invoices(invoices)
+        return {
+            'name': _('Validación de facturas'),
+            'type': 'ir.actions.act_window',
+            'res_model': 'account.invoice.validation.job',
+            'view_mode': 'form',
+            'res_id': job.id,
+        }
@@ -0,0 +1,147 @@
+# -*- encoding: utf-8 -*-
+
+from odoo import models, api
+
+from .tax_cache import TAX_LINE_STATES
+
+
+class DiscountProductCacheMixin(models.AbstractModel):
+    """ Clears the cached product values of the discount lines when a field
+    they are computed from changes. Clearing empties the whole registry
+    cache, so it is limited to ``_discount_cache_fields``; new records are
+    not in the cache yet, except for the fiscal position mappings, and
+    deleted records only matter if cached values may hold them. """
+    _name = 'account.invoice.line.discounts.cache.mixin'
+    _description = 'Discount lines product cache invalidation'
+
+    _discount_cache_fields = ()
+    _discount_cache_on_create = False
+    _discount_cache_on_unlink = False
+
+    def _clear_discount_product_cache(self):
+        self.env['account.invoice.line.discounts'].clear_caches()
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        res = super(DiscountProductCacheMixin, self).create(vals_list)
+        if self._discount_cache_on_create:
+            self._clear_discount_product_cache()
+        return res
+
+    @api.multi
+    def write(self, vals):
+        res = super(DiscountProductCacheMixin, self).write(vals)
+        if any(name in vals for name in self._discount_cache_fields):
+            self._clear_discount_product_cache()
+        return res
+
+    @api.multi
+    def _discount_cache_unlink_needed(self):
+        """ Whether the records may appear in cached values. The ids of
+        deleted keys are never looked up again. """
+        return self._discount_cache_on_unlink
+
+    @api.multi
+    def unlink(self):
+        clear = self and self._discount_cache_unlink_needed()
+        res = super(DiscountProductCacheMixin, self).unlink()
+        if clear:
+            self._clear_discount_product_cache()
+        return res
+
+
+class ProductTemplate(models.Model):
+    _name = 'product.template'
+    _inherit = ['product.template', 'account.invoice.line.discounts.cache.mixin']
+
+    _discount_cache_fields = (
+        'taxes_id', 'supplier_taxes_id', 'property_account_income_id', 'property_account_expense_id',
+        'categ_id', 'name', 'description_sale', 'description_purchase', 'uom_id', 'company_id',
+    )
+
+
+class ProductProduct(models.Model):
+    _name = 'product.product'
+    _inherit = ['product.product', 'account.invoice.line.discounts.cache.mixin']
+
+    # Template fields written through a variant reach the template write
+    _discount_cache_fields = ('product_tmpl_id', 'default_code', 'attribute_value_ids')
+
+
+class ProductCategory(models.Model):
+    _name = 'product.category'
+    _inherit = ['product.category', 'account.invoice.line.discounts.cache.mixin']
+
+    _discount_cache_fields = ('parent_id', 'property_account_income_categ_id', 'property_account_expense_categ_id')
+
+
+class AccountTax(models.Model):
+    _name = 'account.tax'
+    _inherit = ['account.tax', 'account.invoice.line.discounts.cache.mixin']
+
+    _discount_cache_fields = ('company_id', 'active')
+
+    @api.multi
+    def _discount_cache_unlink_needed(self):
+        # Cached values hold the taxes of products and fiscal positions
+        self._cr.execute("""
+            SELECT 1 FROM product_taxes_rel WHERE tax_id IN %(ids)s
+            UNION ALL
+            SELECT 1 FROM product_supplier_taxes_rel WHERE tax_id IN %(ids)s
+            UNION ALL
+            SELECT 1 FROM account_fiscal_position_tax WHERE tax_src_id IN %(ids)s OR tax_dest_id IN %(ids)s
+            LIMIT 1
+        """, {'ids': tuple(self.ids)})
+        return bool(self._cr.fetchone())
+
+    @api.multi
+    def write(self, vals):
+        res = super(AccountTax, self).write(vals)
+        # Other workers see the new write date in the tax signature of the
+        # incremental computation; within a transaction it does not change
+        TAX_LINE_STATES.clear()
+        return res
+
+
+class AccountAccount(models.Model):
+    _name = 'account.account'
+    _inherit = ['account.account', 'account.invoice.line.discounts.cache.mixin']
+
+    _discount_cache_fields = ('company_id', 'deprecated')
+
+    @api.multi
+    def _discount_cache_unlink_needed(self):
+        # Cached values hold the accounts of products, categories and
+        # fiscal positions
+        self._cr.execute("""
+            SELECT 1 FROM ir_property WHERE value_reference IN %(refs)s
+            UNION ALL
+            SELECT 1 FROM account_fiscal_position_account WHERE account_src_id IN %(ids)s OR account_dest_id IN %(ids)s
+            LIMIT 1
+        """, {'ids': tuple(self.ids), 'refs': tuple('account.account,%s' % account_id for account_id in self.ids)})
+        return bool(self._cr.fetchone())
+
+
+class AccountFiscalPosition(models.Model):
+    _name = 'account.fiscal.position'
+    _inherit = ['account.fiscal.position', 'account.invoice.line.discounts.cache.mixin']
+
+    _discount_cache_fields = ('tax_ids', 'account_ids', 'company_id')
+
+
+class AccountFiscalPositionTax(models.Model):
+    _name = 'account.fiscal.position.tax'
+    _inherit = ['account.fiscal.position.tax', 'account.invoice.line.discounts.cache.mixin']
+
+    _discount_cache_fields = ('position_id', 'tax_src_id', 'tax_dest_id')
+    _discount_cache_on_create = True
+    _discount_cache_on_unlink = True
+
+
+class AccountFiscalPositionAccount(models.Model):
+    _name = 'account.fiscal.position.account'
+    _inherit = ['account.fiscal.position.account', 'account.invoice.line.discounts.cache.mixin']
+
+    _discount_cache_fields = ('position_id', 'account_src_id', 'account_dest_id')
+    _discount_cache_on_create = True
+    _discount_cache_on_unlink = True
@@ -0,0 +1,127 @@
+# -*- encoding: utf-8 -*-
+import logging
+
+from odoo import fields, models, api
+from odoo.addons.base.models.ir_sequence import _update_nogap
+
+_logger = logging.getLogger(__name__)
+
+
+class AccountMoveSequenceReserved(models.Model):
+    """ Move names reserved in advance for a journal sequence. Posting takes
+    the names it needs from the pool, rows locked with SKIP LOCKED so
+    concurrent posts do not wait for each other, and only locks the
+    sequence row to reserve a new block when the pool is empty. Everything
+    happens in the posting transaction: a rolled back post leaves its names
+    and the sequence counter as they were, so no number is lost. Its names
+    are then handed out again, possibly after higher ones were posted. """
+    _name = 'account.move.sequence.reserved'
+    _description = 'Reserved move names'
+    _order = 'number, id'
+
+    sequence_id = fields.Many2one('ir.sequence', required=True, ondelete='cascade')
+    date_range_id = fields.Many2one('ir.sequence.date_range', ondelete='cascade')
+    prefix = fields.Char()
+    number = fields.Integer(required=True)
+    name = fields.Char(required=True)
+
+    @api.model_cr
+    def init(self):
+        self._cr.execute("""
+            CREATE INDEX IF NOT EXISTS account_move_sequence_reserved_lookup_idx
+            ON account_move_sequence_reserved (sequence_id, date_range_id, prefix, number)
+        """)
+
+    @api.model
+    def _get_sequence_date(self, sequence, date):
+        """ Returns the sequence in the context used to number a move at
+        ``date`` and the date range holding its counter, created if needed. """
+        sequence = sequence.with_context(ir_sequence_date=date)
+        if not sequence.use_date_range:
+            return sequence, self.env['ir.sequence.date_range']
+        seq_date = self.env['ir.sequence.date_range'].search([
+            ('sequence_id', '=', sequence.id),
+            ('date_from', '<=', date),
+            ('date_to', '>=', date),
+        ], limit=1)
+        if not seq_date:
+            seq_date = sequence._create_date_range_seq(date)
+        return sequence.with_context(ir_sequence_date_range=seq_date.date_from), seq_date
+
+    @api.model
+    def _pop(self, key, count):
+        self._cr.execute("""
+            DELETE FROM account_move_sequence_reserved
+            WHERE id IN (
+                SELECT id FROM account_move_sequence_reserved
+                WHERE sequence_id = %s AND date_range_id IS NOT DISTINCT FROM %s
+                  AND prefix IS NOT DISTINCT FROM %s
+                ORDER BY number
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING number, name
+        """, key + (count,))
+        return sorted(self._cr.fetchall())
+
+    @api.model
+    def _insert(self, key, numbers):
+        if not numbers:
+            return
+        self._cr.execute("""
+            INSERT INTO account_move_sequence_reserved
+                (sequence_id, date_range_id, prefix, number, name,
+                 create_uid, create_date, write_uid, write_date)
+            VALUES """ + ', '.join(["(%s, %s, %s, %s, %s, %s, now() at time zone 'UTC', %s, now() at time zone 'UTC')"] * len(numbers)),
+            [value for number, name in numbers for value in key + (number, name, self.env.uid, self.env.uid)])
+
+    @api.model
+    def take(self, sequence, date, block_size, count=1):
+        """ Returns ``count`` names of ``sequence`` for ``date``, in order,
+        taken from the pool or from a new block of ``block_size`` numbers
+        reserved with a single update of the no_gap counter. The names and
+        the rest of the block are committed or rolled back with the current
+        transaction. """
+        sequence, seq_date = self._get_sequence_date(sequence, date)
+        key = (sequence.id, seq_date.id or None, '%s|%s' % sequence._get_prefix_suffix())
+        taken = self._pop(key, count)
+        if len(taken) < count:
+            size = max(block_size, count - len(taken))
+            increment = sequence.number_increment
+            # Locks the counter until the end of the transaction, like a
+            # standard no_gap sequence, once per block
+            start = _update_nogap(seq_date or sequence, increment * size)
+            numbers = [(start + i * increment, sequence.get_next_char(start + i * increment))
+                       for i in range(size)]
+            missing = count - len(taken)
+            taken += numbers[:missing]
+            self._insert(key, numbers[missing:])
+            _logger.debug("Reserved %s numbers of sequence %s", size, sequence.id)
+        return [name for number, name in taken]
+
+
+class AccountMove(models.Model):
+    _inherit = 'account.move'
+
+    @api.multi
+    def post(self, invoice=False):
+        Reserved = self.env['account.move.sequence.reserved']
+        groups = {}
+        for move in self:
+            journal = move.journal_id
+            if move.name != '/' or not journal.sequence_block_size:
+                continue
+            # Same choice of name or sequence as account.move.post
+            if invoice and invoice.move_name and invoice.move_name != '/':
+                continue
+            sequence = journal.sequence_id
+            if invoice and invoice.type in ['out_refund', 'in_refund'] and journal.refund_sequence:
+                sequence = journal.refund_sequence_id
+            # Standard sequences use nextval and never block each other
+            if not sequence or sequence.implementation != 'no_gap':
+                continue
+            groups.setdefault((sequence, move.date, journal.sequence_block_size), []).append(move)
+        for (sequence, date, block_size), moves in groups.items():
+            for move, name in zip(moves, Reserved.take(sequence, date, block_size, len(moves))):
+                move.name = name
+        return super(AccountMove, self).post(invoice=invoice)
@@ -0,0 +1,58 @@
+# -*- encoding: utf-8 -*-
+import logging
+from collections import Counter
+
+from odoo.tools.lru import LRU
+
+_logger = logging.getLogger(__name__)
+
+# Cumulative hit/miss counters of the current worker process
+TAX_CACHE_STATS = Counter()
+
+# Per invoice state of the incremental tax computation, keyed by (db, invoice id)
+TAX_LINE_STATES = LRU(512)
+
+
+class TaxComputeCache(object):
+    """ Memoizes ``account.tax.compute_all`` and tax grouping keys during one
+    tax computation. Lines sharing the same (taxes, price, quantity, product,
+    partner, currency) signature are computed only once.
+    """
+
+    def __init__(self, env):
+        self.env = env
+        self.stats = Counter()
+        self._taxes = {}
+        self._results = {}
+        self._grouping_keys = {}
+
+    def _count(self, name, hit):
+        self.stats['%s_%s' % (name, hit and 'hits' or 'misses')] += 1
+
+    def compute_all(self, taxes, price_unit, currency, quantity, product, partner):
+        key = (tuple(taxes.ids), price_unit, currency.id, quantity, product.id, partner.id)
+        hit = key in self._results
+        if not hit:
+            self._results[key] = taxes.compute_all(price_unit, currency, quantity, product, partner)
+        self._count('compute_all', hit)
+        return self._results[key]
+
+    def tax(self, tax_id):
+        if tax_id not in self._taxes:
+            self._taxes[tax_id] = self.env['account.tax'].browse(tax_id)
+        return self._taxes[tax_id]
+
+    def grouping_key(self, tax_id, val):
+        # Fields account.tax.get_grouping_key builds the key from
+        key = (tax_id, val.get('account_id'), val.get('account_analytic_id'),
+               str(val.get('analytic_tag_ids', [])))
+        hit = key in self._grouping_keys
+        if not hit:
+            self._grouping_keys[key] = self.tax(tax_id).get_grouping_key(val)
+        self._count('grouping_key', hit)
+        return self._grouping_keys[key]
+
+    def flush_stats(self):
+        TAX_CACHE_STATS.update(self.stats)
+        _logger.debug("Tax cache: %s", dict(self.stats))
+        return self.stats
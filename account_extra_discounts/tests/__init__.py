@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+
+from . import test_benchmark
+from . import test_discount_cascade
+from . import test_incremental_taxes
+from . import test_move_create_bulk
@@ -0,0 +1,141 @@
+# -*- encoding: utf-8 -*-
+""" Benchmark of the extra discounts invoice pipeline.
+
+Not part of the standard tests, run it on a database with a chart of
+accounts installed::
+
+    odoo-bin -d bench -i account_extra_discounts --test-enable \\
+        --test-tags benchmark --stop-after-init
+
+Environment variables:
+
+* ``DISCOUNTS_BENCH_SCENARIOS``: comma separated list of
+  ``lines:discounts:taxes:currencies:invoices`` scenarios.
+* ``DISCOUNTS_BENCH_OUTPUT``: JSON file the results are written to.
+"""
+import json
+import logging
+import os
+import time
+
+from odoo import fields
+from odoo.tests.common import SavepointCase, tagged
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_SCENARIOS = '10:2:1:1:5,100:10:2:1:5,500:20:3:2:2'
+DEFAULT_OUTPUT = 'account_extra_discounts_benchmark.json'
+
+
+def _parse_scenarios(value):
+    keys = ('lines', 'discounts', 'taxes', 'currencies', 'invoices')
+    return [dict(zip(keys, [int(v) for v in scenario.split(':')]))
+            for scenario in value.split(',') if scenario.strip()]
+
+
+@tagged('-standard', 'benchmark')
+class TestDiscountsBenchmark(SavepointCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestDiscountsBenchmark, cls).setUpClass()
+        cls.company = cls.env.user.company_id
+        cls.journal = cls.env['account.journal'].search([
+            ('type', '=', 'sale'), ('company_id', '=', cls.company.id)], limit=1)
+        cls.income_account = cls.env['account.account'].search([
+            ('company_id', '=', cls.company.id),
+            ('user_type_id', '=', cls.env.ref('account.data_account_type_revenue').id),
+        ], limit=1)
+        cls.partner = cls.env['res.partner'].create({'name': 'Benchmark partner'})
+        cls.product = cls.env['product.product'].create({
+            'name': 'Benchmark product',
+            'lst_price': 10.0,
+        })
+        cls.currencies = cls.company.currency_id | cls.env['res.currency'].with_context(active_test=False).search([
+            ('id', '!=', cls.company.currency_id.id)], limit=4)
+        cls.currencies.write({'active': True})
+        cls.results = []
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.results:
+            output = os.environ.get('DISCOUNTS_BENCH_OUTPUT', DEFAULT_OUTPUT)
+            with open(output, 'w') as f:
+                json.dump({
+                    'date': fields.Datetime.to_string(fields.Datetime.now()),
+                    'database': cls.env.cr.dbname,
+                    'scenarios': cls.results,
+                }, f, indent=2, sort_keys=True)
+            _logger.info("Benchmark results written to %s", output)
+        super(TestDiscountsBenchmark, cls).tearDownClass()
+
+    def _create_taxes(self, count):
+        return self.env['account.tax'].concat(*[self.env['account.tax'].create({
+            'name': 'Benchmark tax %s' % i,
+            'amount': 5.0 + i,
+            'type_tax_use': 'sale',
+            'company_id': self.company.id,
+        }) for i in range(count)])
+
+    def _create_invoices(self, params):
+        taxes = self._create_taxes(params['taxes'])
+        vals_list = []
+        for i in range(params['invoices']):
+            currency = self.currencies[i % min(params['currencies'], len(self.currencies))]
+            vals_list.append({
+                'partner_id': self.partner.id,
+                'journal_id': self.journal.id,
+                'currency_id': currency.id,
+                'type': 'out_invoice',
+                'invoice_line_ids': [(0, 0, {
+                    'name': 'Line %s' % n,
+                    'product_id': self.product.id,
+                    'account_id': self.income_account.id,
+                    'quantity': 1 + n % 5,
+                    'price_unit': 10.0 + n % 7,
+                    'invoice_line_tax_ids': [(6, 0, taxes[n % len(taxes)].ids if taxes else [])],
+                }) for n in range(params['lines'])],
+                'account_invoice_line_discount_ids': [(0, 0, {
+                    'name': 'Discount %s' % n,
+                    'sequence': n,
+                    'account_id': self.income_account.id,
+                    'compute_type': n % 3 and 'discount' or 'charge',
+                    'compute_mode': n % 2 and 'amount' or 'percent',
+                    'discount': 1.0 + n % 4,
+                    'price_unit': 5.0,
+                    'invoice_line_tax_ids': [(6, 0, taxes[n % len(taxes)].ids if taxes else [])],
+                }) for n in range(params['discounts'])],
+            })
+        return self.env['account.invoice'].create(vals_list)
+
+    def _measure(self, stages, name, invoices, method):
+        invoices.invalidate_cache()
+        queries = self.cr.sql_log_count
+        start = time.time()
+        method()
+        stages[name] = {
+            'seconds': time.time() - start,
+            'queries': self.cr.sql_log_count - queries,
+            'records': len(invoices),
+        }
+
+    def _run_scenario(self, params):
+        if not self.journal or not self.income_account:
+            self.skipTest("A chart of accounts is required to run the benchmark")
+        invoices = self._create_invoices(params)
+        stages = {}
+        self._measure(stages, 'discount_cascade', invoices, invoices._apply_discount_cascade)
+        self._measure(stages, 'compute_amount', invoices, invoices._compute_amount)
+        self._measure(stages, 'get_taxes_values', invoices, lambda: [
+            inv.get_taxes_values() for inv in invoices])
+        invoices.compute_taxes()
+        self._measure(stages, 'discounts_move_line_get', invoices, lambda: [
+            inv.invoice_line_discounts_move_line_get() for inv in invoices])
+        self._measure(stages, 'action_move_create', invoices, invoices.action_move_create)
+        self.results.append({'params': params, 'stages': stages})
+        _logger.info("Benchmark %s: %s", params, stages)
+
+    def test_benchmark(self):
+        for params in _parse_scenarios(os.environ.get('DISCOUNTS_BENCH_SCENARIOS', DEFAULT_SCENARIOS)):
+            with self.subTest(**params):
+                self._run_scenario(params)
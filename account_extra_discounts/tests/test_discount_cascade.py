@@ -0,0 +1,70 @@
+# -*- encoding: utf-8 -*-
+from odoo.tests.common import BaseCase
+
+from odoo.addons.account_extra_discounts.models.discount_cascade import compute_cascade
+
+
+def _round(value):
+    return round(value, 2)
+
+
+class TestDiscountCascade(BaseCase):
+
+    def test_percent_discount(self):
+        results, total = compute_cascade(200.0, [(10, 'discount', 'percent', 10.0)])
+        self.assertEqual(results, [(20.0, 20.0)])
+        self.assertEqual(total, 180.0)
+
+    def test_amount_charge_with_quantity(self):
+        results, total = compute_cascade(100.0, [(10, 'charge', 'amount', 2.5, 4)])
+        self.assertEqual(results, [(2.5, 10.0)])
+        self.assertEqual(total, 110.0)
+
+    def test_percent_applies_to_running_subtotal(self):
+        results, total = compute_cascade(100.0, [
+            (1, 'discount', 'percent', 10.0),
+            (2, 'discount', 'percent', 10.0),
+            (3, 'charge', 'percent', 50.0),
+        ])
+        self.assertEqual([subtotal for price_unit, subtotal in results], [10.0, 9.0, 40.5])
+        self.assertAlmostEqual(total, 121.5)
+
+    def test_order_by_sequence_keeps_input_order(self):
+        # Applied by sequence (charge first), reported in input order
+        results, total = compute_cascade(100.0, [
+            (20, 'discount', 'percent', 10.0),
+            (10, 'charge', 'amount', 20.0),
+        ])
+        self.assertEqual(results, [(12.0, 12.0), (20.0, 20.0)])
+        self.assertEqual(total, 108.0)
+
+    def test_equal_sequences_follow_input(self):
+        results, total = compute_cascade(100.0, [
+            (10, 'discount', 'amount', 50.0),
+            (10, 'discount', 'percent', 10.0),
+        ])
+        self.assertEqual(results[1], (5.0, 5.0))
+        self.assertEqual(total, 45.0)
+
+    def test_rounding(self):
+        results, total = compute_cascade(10.0, [(1, 'discount', 'percent', 33.333)], round_curr=_round)
+        self.assertEqual(results[0][1], 3.33)
+        self.assertAlmostEqual(total, 6.67)
+
+    def test_unknown_type_and_empty_value(self):
+        results, total = compute_cascade(100.0, [(1, False, 'percent', 10.0), (2, 'discount', 'amount', False)])
+        self.assertEqual(results, [(10.0, 10.0), (0.0, 0.0)])
+        self.assertEqual(total, 100.0)
+
+    def test_untaxed_subtotal(self):
+        # Prices including a 21% tax: the cascade runs on the untaxed amounts
+        def get_subtotal(index, price_unit, quantity):
+            return _round(quantity * price_unit / 1.21)
+
+        results, total = compute_cascade(100.0, [
+            (1, 'charge', 'amount', 12.1),
+            (2, 'discount', 'percent', 10.0),
+        ], round_curr=_round, get_subtotal=get_subtotal)
+        self.assertEqual(results[0], (12.1, 10.0))
+        self.assertEqual(results[1][1], _round(11.0 / 1.21))
+        self.assertAlmostEqual(total, 110.0 - _round(11.0 / 1.21))
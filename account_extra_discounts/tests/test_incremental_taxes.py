@@ -0,0 +1,99 @@
+# -*- encoding: utf-8 -*-
+from odoo.tests.common import SavepointCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestIncrementalTaxes(SavepointCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestIncrementalTaxes, cls).setUpClass()
+        cls.company = cls.env.user.company_id
+        cls.journal = cls.env['account.journal'].search([
+            ('type', '=', 'sale'), ('company_id', '=', cls.company.id)], limit=1)
+        cls.income_account = cls.env['account.account'].search([
+            ('company_id', '=', cls.company.id),
+            ('user_type_id', '=', cls.env.ref('account.data_account_type_revenue').id),
+        ], limit=1)
+        cls.partner = cls.env['res.partner'].create({'name': 'Incremental taxes partner'})
+        cls.product = cls.env['product.product'].create({'name': 'Incremental taxes product'})
+        cls.tax_a, cls.tax_b = [cls.env['account.tax'].create({
+            'name': 'Incremental tax %s' % amount,
+            'amount': amount,
+            'type_tax_use': 'sale',
+            'company_id': cls.company.id,
+        }) for amount in (10.0, 21.0)]
+
+    def setUp(self):
+        super(TestIncrementalTaxes, self).setUp()
+        if not self.journal or not self.income_account:
+            self.skipTest("A chart of accounts is required")
+
+    def _line(self, price_unit, quantity, taxes):
+        return (0, 0, {
+            'name': 'Line',
+            'product_id': self.product.id,
+            'account_id': self.income_account.id,
+            'quantity': quantity,
+            'price_unit': price_unit,
+            'invoice_line_tax_ids': [(6, 0, taxes.ids)],
+        })
+
+    def _discount(self, compute_mode, discount, taxes):
+        return (0, 0, {
+            'name': 'Discount',
+            'account_id': self.income_account.id,
+            'compute_type': 'discount',
+            'compute_mode': compute_mode,
+            'discount': discount,
+            'price_unit': discount,
+            'invoice_line_tax_ids': [(6, 0, taxes.ids)],
+        })
+
+    def _summary(self, invoice, tax_grouped):
+        round_curr = invoice.currency_id.round
+        return {key: (round_curr(val['base']), round_curr(val['amount'])) for key, val in tax_grouped.items()}
+
+    def assertIncrementalTaxes(self, invoice):
+        invoice.invalidate_cache()
+        self.assertEqual(self._summary(invoice, invoice._get_taxes_values_incremental()),
+                         self._summary(invoice, invoice.get_taxes_values()))
+
+    def test_incremental_taxes(self):
+        invoice = self.env['account.invoice'].create({
+            'partner_id': self.partner.id,
+            'journal_id': self.journal.id,
+            'type': 'out_invoice',
+            'invoice_line_ids': [
+                self._line(100.0, 2, self.tax_a),
+                self._line(50.0, 1, self.tax_b),
+                self._line(50.0, 1, self.tax_b),
+            ],
+            'account_invoice_line_discount_ids': [self._discount('percent', 10.0, self.tax_a)],
+        })
+        self.assertIncrementalTaxes(invoice)
+
+        # Add lines, one with a signature already present
+        invoice.write({'invoice_line_ids': [self._line(50.0, 1, self.tax_b),
+                                            self._line(30.0, 3, self.tax_a | self.tax_b)]})
+        self.assertIncrementalTaxes(invoice)
+
+        # Edit a line
+        invoice.invoice_line_ids[0].write({'price_unit': 80.0})
+        self.assertIncrementalTaxes(invoice)
+
+        # Remove a line
+        invoice.write({'invoice_line_ids': [(2, invoice.invoice_line_ids[-1].id)]})
+        self.assertIncrementalTaxes(invoice)
+
+        # Add, edit and remove discount/charge lines
+        invoice.write({'account_invoice_line_discount_ids': [self._discount('amount', 15.0, self.tax_b)]})
+        self.assertIncrementalTaxes(invoice)
+        invoice.account_invoice_line_discount_ids[0].write({'discount': 5.0})
+        self.assertIncrementalTaxes(invoice)
+        invoice.write({'account_invoice_line_discount_ids': [(2, invoice.account_invoice_line_discount_ids[0].id)]})
+        self.assertIncrementalTaxes(invoice)
+
+        # Edit a tax used by the lines
+        self.tax_a.write({'amount': 12.0})
+        self.assertIncrementalTaxes(invoice)
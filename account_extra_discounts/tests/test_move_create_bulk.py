@@ -0,0 +1,101 @@
+# -*- encoding: utf-8 -*-
+from odoo import fields
+from odoo.tests.common import SavepointCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestMoveCreateBulk(SavepointCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestMoveCreateBulk, cls).setUpClass()
+        cls.company = cls.env.user.company_id
+        cls.journal = cls.env['account.journal'].search([
+            ('type', '=', 'sale'), ('company_id', '=', cls.company.id)], limit=1)
+        cls.income_account = cls.env['account.account'].search([
+            ('company_id', '=', cls.company.id),
+            ('user_type_id', '=', cls.env.ref('account.data_account_type_revenue').id),
+        ], limit=1)
+        cls.journal.write({'refund_sequence': True})
+        cls.partner = cls.env['res.partner'].create({'name': 'Bulk moves partner'})
+        cls.product = cls.env['product.product'].create({'name': 'Bulk moves product'})
+        cls.tax = cls.env['account.tax'].create({
+            'name': 'Bulk moves tax',
+            'amount': 21.0,
+            'type_tax_use': 'sale',
+            'company_id': cls.company.id,
+        })
+
+    def setUp(self):
+        super(TestMoveCreateBulk, self).setUp()
+        if not self.journal or not self.income_account:
+            self.skipTest("A chart of accounts is required")
+
+    def _create_invoices(self, reused_name):
+        """ An invoice, a credit note, an invoice reusing the name of a
+        cancelled move and another invoice, with discount lines. """
+        date = fields.Date.today()
+        vals_list = []
+        for i, inv_type in enumerate(['out_invoice', 'out_refund', 'out_invoice', 'out_invoice']):
+            vals_list.append({
+                'partner_id': self.partner.id,
+                'journal_id': self.journal.id,
+                'type': inv_type,
+                'date_invoice': date,
+                'move_name': i == 2 and reused_name or False,
+                'invoice_line_ids': [(0, 0, {
+                    'name': 'Line %s' % n,
+                    'product_id': self.product.id,
+                    'account_id': self.income_account.id,
+                    'quantity': 1 + n,
+                    'price_unit': 10.0 * (i + 1),
+                    'invoice_line_tax_ids': [(6, 0, self.tax.ids)],
+                }) for n in range(3)],
+                'account_invoice_line_discount_ids': [(0, 0, {
+                    'name': 'Discount',
+                    'account_id': self.income_account.id,
+                    'compute_type': 'discount',
+                    'compute_mode': 'percent',
+                    'discount': 5.0,
+                    'invoice_line_tax_ids': [(6, 0, self.tax.ids)],
+                })],
+            })
+        return self.env['account.invoice'].create(vals_list)
+
+    def _summary(self, invoice):
+        move = invoice.move_id
+        lines = sorted((
+            line.account_id.id, line.partner_id.id, line.debit, line.credit, line.amount_currency,
+            line.tax_line_id.id, tuple(line.tax_ids.ids), line.date_maturity, line.name,
+        ) for line in move.line_ids)
+        return (invoice.date, invoice.date_due, move.journal_id.id, move.date, move.ref, move.state,
+                move.amount, lines)
+
+    def _numbers(self, invoices):
+        """ Sequence prefix of every move name and its number relative to the
+        first name of the same prefix. """
+        firsts = {}
+        res = []
+        for invoice in invoices:
+            prefix, number = invoice.move_name.rsplit('/', 1)
+            firsts.setdefault(prefix, int(number))
+            res.append((prefix, int(number) - firsts[prefix]))
+        return res
+
+    def test_bulk_matches_single(self):
+        single = self._create_invoices('REUSED/SINGLE/0001')
+        bulk = self._create_invoices('REUSED/BULK/0001')
+        for invoice in single:
+            invoice.action_move_create()
+        bulk.action_move_create()
+
+        for single_invoice, bulk_invoice in zip(single, bulk):
+            self.assertTrue(bulk_invoice.move_id)
+            self.assertEqual(bulk_invoice.move_name, bulk_invoice.move_id.name)
+            self.assertEqual(self._summary(bulk_invoice), self._summary(single_invoice))
+        self.assertEqual(single[2].move_name, 'REUSED/SINGLE/0001')
+        self.assertEqual(bulk[2].move_name, 'REUSED/BULK/0001')
+
+        others = [0, 1, 3]
+        self.assertEqual(self._numbers(bulk[i] for i in others), self._numbers(single[i] for i in others))
+        self.assertNotEqual(bulk[1].move_name.rsplit('/', 1)[0], bulk[0].move_name.rsplit('/', 1)[0])
@@ -11,9 +11,13 @@
     ],
     'data': [
         # 'security/security.xml',
+        'security/ir.model.access.csv',
         # 'data/account.tax.csv',
         'views/wizard_view.xml',
         'views/account_tax_view.xml',
+        'views/account_digits_renumber_job_view.xml',
+        'views/account_chart_transfer_view.xml',
+        'data/ir_cron.xml',
     ],
     'installable': True,
     'auto_install': False,
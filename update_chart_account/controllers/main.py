@@ -0,0 +1,59 @@
+# -*- encoding: utf-8 -*-
+import csv
+import io
+
+import odoo
+from odoo import http
+from odoo.http import request, content_disposition
+
+from ..models.account_chart_transfer import CSV_COLUMNS
+
+EXPORT_QUERY = """
+    DECLARE account_chart_export NO SCROLL CURSOR FOR
+    SELECT a.code, a.name,
+           COALESCE((SELECT d.module || '.' || d.name FROM ir_model_data d
+                     WHERE d.model = 'account.account.type' AND d.res_id = t.id
+                     ORDER BY d.id LIMIT 1), t.name),
+           a.reconcile
+    FROM account_account a
+    JOIN account_account_type t ON t.id = a.user_type_id
+    WHERE a.company_id = %s
+    ORDER BY a.code
+"""
+
+
+def _stream_accounts(dbname, company_id, batch_size):
+    """ Yields the CSV in chunks read from a server side cursor opened in its
+    own transaction, as the request cursor is closed once streaming starts. """
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(CSV_COLUMNS)
+    with odoo.registry(dbname).cursor() as cr:
+        cr.execute(EXPORT_QUERY, (company_id,))
+        while True:
+            cr.execute("FETCH FORWARD %s FROM account_chart_export", (batch_size,))
+            rows = cr.fetchall()
+            if not rows:
+                break
+            writer.writerows(rows)
+            yield buf.getvalue().encode('utf-8')
+            buf.seek(0)
+            buf.truncate()
+        cr.execute("CLOSE account_chart_export")
+    yield buf.getvalue().encode('utf-8')
+
+
+class AccountChartExport(http.Controller):
+
+    @http.route('/update_chart_account/accounts/export', type='http', auth='user')
+    def export_accounts(self, company_id, batch_size=1000, **kw):
+        user = request.env.user
+        company_id = int(company_id)
+        if not user.has_group('account.group_account_manager') or company_id not in user.company_ids.ids:
+            return request.not_found()
+        return request.make_response(
+            _stream_accounts(request.env.cr.dbname, company_id, max(int(batch_size), 1)),
+            headers=[
+                ('Content-Type', 'text/csv'),
+                ('Content-Disposition', content_disposition('accounts_%s.csv' % company_id)),
+            ])
@@ -1,2 +1,4 @@
 # -*- coding: utf-8 -*-
 from . import account_tax
+from . import account_digits_renumber_job
+from . import account_chart_transfer
@@ -0,0 +1,129 @@
+# -*- encoding: utf-8 -*-
+import base64
+import csv
+import io
+import logging
+
+from odoo import fields, models, api, exceptions, _
+
+from .account_tax import pad_account_code
+
+_logger = logging.getLogger(__name__)
+
+CSV_COLUMNS = ['code', 'name', 'user_type_id', 'reconcile']
+
+
+class AccountChartTransferWizard(models.TransientModel):
+    _name = 'account.chart.transfer.wizard'
+
+    company_id = fields.Many2one(
+        comodel_name='res.company',
+        string=_('Company'),
+        required=True,
+        default=lambda self: self.env.user.company_id,
+    )
+
+    number_of_digits = fields.Integer(
+        string=_('Number of digits'),
+        help="Codes are zero filled to this length while importing, "
+             "the same way the digits update wizard does. Ignored up to 6 digits.",
+    )
+
+    batch_size = fields.Integer(
+        string=_('Batch size'),
+        default=1000,
+    )
+
+    data_file = fields.Binary(
+        string=_('File'),
+    )
+
+    filename = fields.Char()
+
+    imported_count = fields.Integer(
+        string=_('Imported'),
+        readonly=True,
+    )
+
+    duplicate_count = fields.Integer(
+        string=_('Duplicated codes skipped'),
+        readonly=True,
+    )
+
+    def _open_csv(self):
+        if not self.data_file:
+            raise exceptions.UserError(_('Please select a file.'))
+        return io.TextIOWrapper(io.BytesIO(base64.b64decode(self.data_file)), encoding='utf-8', newline='')
+
+    def _get_user_type(self, value, cache):
+        if value not in cache:
+            user_type = self.env.ref(value, raise_if_not_found=False) if '.' in value else None
+            if not user_type:
+                user_type = self.env['account.account.type'].search([('name', '=', value)], limit=1)
+            if not user_type:
+                raise exceptions.UserError(_('Unknown account type: %s') % value)
+            cache[value] = user_type.id
+        return cache[value]
+
+    @api.multi
+    def action_import(self):
+        """ Reads the CSV row by row and creates the accounts in batches.
+        Codes are normalized while reading and checked against an index of
+        the codes already present in the company. """
+        self.ensure_one()
+        AccountObj = self.env['account.account']
+        self.env.cr.execute("SELECT code FROM account_account WHERE company_id = %s", (self.company_id.id,))
+        codes = set(row[0] for row in self.env.cr.fetchall())
+        user_types = {}
+        batch = []
+        imported = duplicated = 0
+
+        with self._open_csv() as csv_file:
+            for row in csv.DictReader(csv_file):
+                code = (row.get('code') or '').strip()
+                if self.number_of_digits > 6:
+                    code = pad_account_code(code, self.number_of_digits)
+                if not code or code in codes:
+                    duplicated += 1
+                    continue
+                codes.add(code)
+                batch.append({
+                    'code': code,
+                    'name': row.get('name') or code,
+                    'user_type_id': self._get_user_type((row.get('user_type_id') or '').strip(), user_types),
+                    'reconcile': (row.get('reconcile') or '').strip().lower() in ('1', 'true', 'yes'),
+                    'company_id': self.company_id.id,
+                })
+                if len(batch) >= self.batch_size:
+                    AccountObj.create(batch)
+                    imported += len(batch)
+                    batch = []
+            if batch:
+                AccountObj.create(batch)
+                imported += len(batch)
+
+        _logger.info("Imported %s accounts in company %s, %s duplicated codes skipped",
+                     imported, self.company_id.name, duplicated)
+        self.write({'imported_count': imported, 'duplicate_count': duplicated})
+        return self._reopen()
+
+    @api.multi
+    def action_export(self):
+        """ Downloads the accounts of the company, streamed by the export
+        controller through a server side cursor. """
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_url',
+            'url': '/update_chart_account/accounts/export?company_id=%s&batch_size=%s' % (
+                self.company_id.id, self.batch_size or 1000),
+            'target': 'self',
+        }
+
+    def _reopen(self):
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
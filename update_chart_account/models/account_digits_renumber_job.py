@@ -0,0 +1,246 @@
+# -*- encoding: utf-8 -*-
+import logging
+import time
+
+import psycopg2
+
+from odoo import fields, models, api, exceptions, _
+from odoo.tools import mute_logger
+
+_logger = logging.getLogger(__name__)
+
+# Jobs with more companies are left to the cron instead of the request
+SYNC_COMPANY_LIMIT = 1
+
+
+class AccountDigitsRenumberJob(models.Model):
+    _name = 'account.digits.renumber.job'
+    _description = 'Chart of accounts renumbering'
+    _order = 'id desc'
+
+    name = fields.Char(
+        string=_('Name'),
+        required=True,
+        default=lambda self: fields.Datetime.to_string(fields.Datetime.now()),
+    )
+
+    number_of_digits = fields.Integer(
+        string=_('Number of digits'),
+        required=True,
+    )
+
+    chunk_size = fields.Integer(
+        string=_('Accounts per transaction'),
+        default=5000,
+    )
+
+    company_ids = fields.Many2many(
+        comodel_name='res.company',
+        string=_('Companies'),
+    )
+
+    line_ids = fields.One2many(
+        comodel_name='account.digits.renumber.job.line',
+        inverse_name='job_id',
+        string=_('Progress'),
+        readonly=True,
+    )
+
+    state = fields.Selection(
+        selection=[
+            ('draft', _('Draft')),
+            ('running', _('Running')),
+            ('done', _('Done')),
+            ('failed', _('Failed')),
+        ],
+        string=_('State'),
+        default='draft',
+        readonly=True,
+    )
+
+    @api.multi
+    def action_start(self):
+        for job in self:
+            if job.number_of_digits <= 6:
+                raise exceptions.UserError(_('The number of digits must be greater than 6.'))
+            job.line_ids.unlink()
+            job.write({
+                'state': 'running',
+                'line_ids': [(0, 0, {'company_id': company.id}) for company in job.company_ids],
+            })
+        self._dispatch()
+
+    @api.multi
+    def action_resume(self):
+        self.mapped('line_ids').filtered(lambda l: l.state == 'failed').write({
+            'state': 'pending',
+            'error': False,
+        })
+        self.write({'state': 'running'})
+        self._dispatch()
+
+    @api.multi
+    def _dispatch(self):
+        """ Runs the jobs of a single company in the request and leaves the
+        others to the cron, which is brought forward. """
+        small = self.filtered(lambda job: len(job.company_ids) <= SYNC_COMPANY_LIMIT)
+        if small != self:
+            self._trigger_cron()
+        self.env.cr.commit()
+        small._run()
+
+    @api.model
+    def _trigger_cron(self):
+        cron = self.env.ref('update_chart_account.ir_cron_resume_renumber_jobs', raise_if_not_found=False)
+        if not cron:
+            return
+        try:
+            with mute_logger('odoo.sql_db'), self.env.cr.savepoint():
+                self.env.cr.execute("SELECT id FROM ir_cron WHERE id = %s FOR UPDATE NOWAIT", (cron.id,))
+                cron.sudo().write({'nextcall': fields.Datetime.now()})
+        except psycopg2.OperationalError:
+            # The cron is running, its next call picks up the jobs
+            pass
+
+    @api.model
+    def _cron_resume_jobs(self):
+        """ Continues the jobs interrupted by a crash or a timeout """
+        self.search([('state', '=', 'running')])._run()
+
+    @api.multi
+    def _run(self):
+        """ Runs every job holding a lock on its row in a cursor of its own
+        for the whole run, as the lines commit after each chunk. A job
+        locked by another worker is skipped. """
+        cr = self.env.cr
+        for job in self:
+            lock_cr = self.pool.cursor()
+            try:
+                try:
+                    with mute_logger('odoo.sql_db'):
+                        lock_cr.execute("SELECT id FROM account_digits_renumber_job WHERE id = %s FOR UPDATE NOWAIT",
+                                        (job.id,))
+                except psycopg2.OperationalError:
+                    _logger.info("Renumbering job %s is running in another worker", job.id)
+                    continue
+                # Start from what the previous holder of the lock committed
+                cr.commit()
+                self.invalidate_cache()
+                if job.state != 'running':
+                    continue
+                for line in job.line_ids.filtered(lambda l: l.state in ('pending', 'running')):
+                    line._run()
+                failed = job.line_ids.filtered(lambda l: l.state == 'failed')
+                # The row is locked by lock_cr, update it there
+                lock_cr.execute("""
+                    UPDATE account_digits_renumber_job
+                    SET state = %s, write_uid = %s, write_date = now() at time zone 'UTC'
+                    WHERE id = %s
+                """, (failed and 'failed' or 'done', self.env.uid, job.id))
+                lock_cr.commit()
+                job.invalidate_cache(['state'], job.ids)
+            finally:
+                lock_cr.close()
+
+
+class AccountDigitsRenumberJobLine(models.Model):
+    _name = 'account.digits.renumber.job.line'
+    _description = 'Chart of accounts renumbering per company'
+    _order = 'job_id, id'
+
+    job_id = fields.Many2one(
+        comodel_name='account.digits.renumber.job',
+        required=True,
+        ondelete='cascade',
+    )
+
+    company_id = fields.Many2one(
+        comodel_name='res.company',
+        string=_('Company'),
+        required=True,
+    )
+
+    state = fields.Selection(
+        selection=[
+            ('pending', _('Pending')),
+            ('running', _('Running')),
+            ('done', _('Done')),
+            ('failed', _('Failed')),
+        ],
+        string=_('State'),
+        default='pending',
+    )
+
+    last_account_id = fields.Integer(
+        string=_('Checkpoint'),
+        help="Highest account id already processed.",
+    )
+
+    accounts_read = fields.Integer(
+        string=_('Accounts processed'),
+    )
+
+    accounts_updated = fields.Integer(
+        string=_('Accounts updated'),
+    )
+
+    duration = fields.Float(
+        string=_('Duration (s)'),
+    )
+
+    throughput = fields.Float(
+        string=_('Accounts/s'),
+        compute='_compute_throughput',
+    )
+
+    error = fields.Text(
+        string=_('Error'),
+    )
+
+    @api.multi
+    @api.depends('accounts_read', 'duration')
+    def _compute_throughput(self):
+        for line in self:
+            line.throughput = line.duration and line.accounts_read / line.duration or 0.0
+
+    @api.multi
+    def _run(self):
+        """ Renumbers the accounts of the company in committed chunks of ids,
+        starting after the last checkpoint. """
+        self.ensure_one()
+        cr = self.env.cr
+        wizard = self.env['account.digits.update.wizard']
+        digits = self.job_id.number_of_digits
+        try:
+            if self.state == 'pending':
+                wizard._check_code_collisions(self.company_id.id, digits)
+                self.state = 'running'
+                cr.commit()
+            while True:
+                start = time.time()
+                cr.execute("""
+                    SELECT id FROM account_account
+                    WHERE company_id = %s AND id > %s
+                    ORDER BY id
+                    LIMIT %s
+                """, (self.company_id.id, self.last_account_id, self.job_id.chunk_size or 5000))
+                account_ids = [row[0] for row in cr.fetchall()]
+                if not account_ids:
+                    break
+                updated = wizard._update_codes(self.company_id.id, digits, account_ids[0], account_ids[-1])
+                self.write({
+                    'last_account_id': account_ids[-1],
+                    'accounts_read': self.accounts_read + len(account_ids),
+                    'accounts_updated': self.accounts_updated + len(updated),
+                    'duration': self.duration + time.time() - start,
+                })
+                cr.commit()
+            self.state = 'done'
+            cr.commit()
+            _logger.info("Renumbered %s accounts of company %s in %.1fs",
+                         self.accounts_updated, self.company_id.name, self.duration)
+        except Exception as e:
+            cr.rollback()
+            _logger.warning("Error renumbering the accounts of company %s", self.company_id.name, exc_info=True)
+            self.write({'state': 'failed', 'error': str(e)})
+            cr.commit()
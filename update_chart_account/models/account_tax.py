@@ -3,6 +3,18 @@
 from odoo import fields, models, api, exceptions, _
 
 
+def pad_account_code(code, number_of_digits):
+    """ Zero fills ``code`` up to ``number_of_digits`` after its first 4
+    digits. Codes already that long (or longer) are kept. """
+    if not code or len(code) >= number_of_digits:
+        return code
+    return code[0:4] + '0' * (number_of_digits - len(code)) + code[4:]
+
+
+# SQL version of pad_account_code, for codes shorter than the target length
+PAD_ACCOUNT_CODE_SQL = "substr(code, 1, 4) || repeat('0', %(digits)s - length(code)) || substr(code, 5)"
+
+
 class AccountDigitsUpdateWizard(models.TransientModel):
     _name = 'account.digits.update.wizard'
 
@@ -15,35 +27,122 @@ class AccountDigitsUpdateWizard(models.TransientModel):
         string=_('Company'),
     )
 
+    dry_run = fields.Boolean(
+        string=_('Preview only'),
+        help="Show the new codes without changing the accounts.",
+    )
+
+    line_ids = fields.One2many(
+        comodel_name='account.digits.update.wizard.line',
+        inverse_name='wizard_id',
+        string=_('Preview'),
+        readonly=True,
+    )
+
+    @api.model
+    def _get_code_changes(self, company_id, number_of_digits):
+        """ Returns (account_id, old_code, new_code) of every account of the
+        company whose code changes. """
+        self.env.cr.execute("""
+            SELECT id, code, """ + PAD_ACCOUNT_CODE_SQL + """
+            FROM account_account
+            WHERE company_id = %(company_id)s AND length(code) < %(digits)s
+            ORDER BY code
+        """, {'company_id': company_id, 'digits': number_of_digits})
+        return self.env.cr.fetchall()
+
+    @api.model
+    def _check_code_collisions(self, company_id, number_of_digits):
+        """ Raises if two accounts of the company would end with the same code """
+        self.env.cr.execute("""
+            SELECT new_code, array_agg(code ORDER BY code)
+            FROM (
+                SELECT code, """ + PAD_ACCOUNT_CODE_SQL + """ AS new_code
+                FROM account_account
+                WHERE company_id = %(company_id)s AND length(code) < %(digits)s
+                UNION ALL
+                SELECT code, code
+                FROM account_account
+                WHERE company_id = %(company_id)s AND length(code) >= %(digits)s
+            ) codes
+            GROUP BY new_code
+            HAVING count(*) > 1
+            ORDER BY new_code
+            LIMIT 50
+        """, {'company_id': company_id, 'digits': number_of_digits})
+        collisions = self.env.cr.fetchall()
+        if collisions:
+            raise exceptions.UserError(_("These account codes would be duplicated:\n%s") % '\n'.join(
+                '%s: %s' % (new_code, ', '.join(codes)) for new_code, codes in collisions))
+
+    @api.model
+    def _update_codes(self, company_id, number_of_digits, min_id=None, max_id=None):
+        """ Pads the codes of the company accounts with a single UPDATE,
+        optionally restricted to an id range. Returns the updated ids. """
+        where = ''
+        if min_id is not None:
+            where += ' AND id >= %(min_id)s'
+        if max_id is not None:
+            where += ' AND id <= %(max_id)s'
+        self.env.cr.execute("""
+            UPDATE account_account
+            SET code = """ + PAD_ACCOUNT_CODE_SQL + """,
+                write_uid = %(uid)s,
+                write_date = (now() at time zone 'UTC')
+            WHERE company_id = %(company_id)s AND length(code) < %(digits)s""" + where + """
+            RETURNING id
+        """, {
+            'company_id': company_id,
+            'digits': number_of_digits,
+            'uid': self.env.uid,
+            'min_id': min_id,
+            'max_id': max_id,
+        })
+        account_ids = [row[0] for row in self.env.cr.fetchall()]
+        self.env['account.account'].invalidate_cache(['code'], account_ids)
+        return account_ids
 
     @api.multi
     def action_update_digits(self):
         if self.number_of_digits <=6:
             return
-        AccountObj = self.env['account.account']
-
-        account_ids = AccountObj.search([
-            ('company_id','=',self.company_id.id)
-        ])
-
-        for account in account_ids:
-            
-            if len(account.code) == self.number_of_digits:
-                continue
-
-            else:
-                c_ini = account.code[0:4]
-                c_fin = account.code[4:]
-                c_add = '0'*(self.number_of_digits-len(account.code))
-                # print(account.code[0:4])
-                # print(account.code[4:])
-                # print('0'*(self.number_of_digits-len(account.code)))
-
-                account.code = c_ini + c_add + c_fin
-
-
-
+        self._check_code_collisions(self.company_id.id, self.number_of_digits)
+
+        if self.dry_run:
+            self.line_ids.unlink()
+            self.write({'line_ids': [(0, 0, {
+                'account_id': account_id,
+                'old_code': old_code,
+                'new_code': new_code,
+            }) for account_id, old_code, new_code in self._get_code_changes(self.company_id.id, self.number_of_digits)]})
+            return {
+                'type': 'ir.actions.act_window',
+                'res_model': self._name,
+                'res_id': self.id,
+                'view_mode': 'form',
+                'target': 'new',
+            }
+
+        self._update_codes(self.company_id.id, self.number_of_digits)
+
+
+class AccountDigitsUpdateWizardLine(models.TransientModel):
+    _name = 'account.digits.update.wizard.line'
+
+    wizard_id = fields.Many2one(
+        comodel_name='account.digits.update.wizard',
+        ondelete='cascade',
+    )
 
+    account_id = fields.Many2one(
+        comodel_name='account.account',
+        string=_('Account'),
+    )
 
+    old_code = fields.Char(
+        string=_('Current code'),
+    )
 
-    
+    new_code = fields.Char(
+        string=_('New code'),
+    )